@@ -0,0 +1,160 @@
+import numpy as np
+
+from features import extract_features
+from matching import hz_to_midi
+from reference import load_reference
+
+# Sakoe-Chiba band half-width, in take notes either side of the diagonal
+BAND_NOTES = 8
+
+# Pitch and rhythm differences are capped so one wrong note cannot outweigh the rest of its evidence.
+# Global position only breaks ties: it drifts with tempo changes and false starts.
+PITCH_COST_CAP = 2.0
+RHYTHM_COST_CAP = 1.0
+RHYTHM_WEIGHT = 1.0
+TIME_WEIGHT = 0.1
+
+_DIAGONAL, _VERTICAL, _HORIZONTAL = 0, 1, 2
+
+
+def relative_positions(onset_times):
+    # Position along the performance in note units, so a faster or slower take lines up with the reference
+    onset_times = np.asarray(onset_times, dtype=float)
+    if len(onset_times) < 2 or onset_times[-1] <= onset_times[0]:
+        return np.zeros(len(onset_times))
+    return (onset_times - onset_times[0]) / (onset_times[-1] - onset_times[0]) * (len(onset_times) - 1)
+
+
+def relative_intervals(onset_times):
+    # Log inter-onset interval after each note against the median, so only local rhythm matters, not tempo
+    intervals = np.diff(np.asarray(onset_times, dtype=float))
+    if len(intervals) == 0 or np.median(intervals) <= 0:
+        return np.zeros(len(onset_times))
+    intervals = np.append(intervals, np.median(intervals))
+    return np.log2(np.maximum(intervals, 1e-3) / np.median(intervals))
+
+
+def band_limits(n_reference, n_take, band):
+    slope = (n_take - 1) / max(n_reference - 1, 1)
+    # Consecutive rows must overlap, and notes added or dropped at one end must stay reachable
+    band = max(band, np.ceil(slope), abs(n_take - n_reference))
+    center = np.arange(n_reference) * slope
+    lo = np.clip(np.floor(center - band), 0, n_take - 1).astype(int)
+    hi = np.clip(np.ceil(center + band), 0, n_take - 1).astype(int)
+    lo[0], hi[-1] = 0, n_take - 1
+    return lo, hi
+
+
+def _band_lookup(row, columns, lo, hi):
+    inside = (columns >= lo) & (columns <= hi)
+    return np.where(inside, row[np.clip(columns - lo, 0, len(row) - 1)], np.inf)
+
+
+def banded_dtw(cost_fn, n_reference, n_take, band=BAND_NOTES):
+    # Only the band is stored: accumulated cost and step codes are n_reference x (2 * band + 1)
+    lo, hi = band_limits(n_reference, n_take, band)
+    width = int((hi - lo).max()) + 1
+    accumulated = np.full((n_reference, width), np.inf)
+    steps = np.zeros((n_reference, width), dtype=np.int8)
+
+    for i in range(n_reference):
+        columns = np.arange(lo[i], hi[i] + 1)
+        cost = cost_fn(i, columns)
+
+        best = np.full(len(columns), np.inf)
+        step = np.zeros(len(columns), dtype=np.int8)
+        if i > 0:
+            # Predecessors outside the previous row's band were never computed and cost inf
+            diagonal = _band_lookup(accumulated[i - 1], columns - 1, lo[i - 1], hi[i - 1])
+            vertical = _band_lookup(accumulated[i - 1], columns, lo[i - 1], hi[i - 1])
+            step = np.where(vertical < diagonal, _VERTICAL, _DIAGONAL).astype(np.int8)
+            best = np.minimum(diagonal, vertical)
+        else:
+            best[0] = 0.0
+
+        # Horizontal steps depend on the cell just computed, so they are the only sequential part
+        row = np.empty(len(columns))
+        for k in range(len(columns)):
+            if k > 0 and row[k - 1] < best[k]:
+                best[k] = row[k - 1]
+                step[k] = _HORIZONTAL
+            row[k] = cost[k] + best[k]
+
+        accumulated[i, :len(columns)] = row
+        steps[i, :len(columns)] = step
+
+    path = []
+    i, j = n_reference - 1, n_take - 1
+    while i >= 0 and j >= 0:
+        path.append((i, j))
+        step = steps[i, j - lo[i]]
+        if i == 0 and j == 0:
+            break
+        if step == _DIAGONAL:
+            i, j = i - 1, j - 1
+        elif step == _VERTICAL:
+            i -= 1
+        else:
+            j -= 1
+    return np.array(path[::-1], dtype=int).reshape(-1, 2), float(accumulated[-1, n_take - 1 - lo[-1]])
+
+
+def align_notes(reference_times, reference_midi, take_times, take_midi, band=BAND_NOTES):
+    reference_midi = np.asarray(reference_midi, dtype=float)
+    take_midi = np.asarray(take_midi, dtype=float)
+    n_reference, n_take = len(reference_times), len(take_times)
+    empty = np.zeros(0, dtype=int)
+    if n_reference == 0 or n_take == 0:
+        return {"reference_notes": empty, "take_notes": empty,
+                "missing": np.arange(n_reference), "extra": np.arange(n_take), "cost": np.inf}
+
+    reference_positions = relative_positions(reference_times)
+    # Take positions are rescaled onto the reference's note count before comparing
+    take_positions = relative_positions(take_times) * ((n_reference - 1) / max(n_take - 1, 1))
+    reference_rhythm = relative_intervals(reference_times)
+    take_rhythm = relative_intervals(take_times)
+
+    def time_cost(i, columns):
+        return np.abs(take_positions[columns] - reference_positions[i])
+
+    def rhythm_cost(i, columns):
+        return np.minimum(np.abs(take_rhythm[columns] - reference_rhythm[i]), RHYTHM_COST_CAP)
+
+    def pitch_cost(i, columns):
+        difference = np.abs(take_midi[columns] - reference_midi[i])
+        return np.minimum(np.nan_to_num(difference, nan=PITCH_COST_CAP), PITCH_COST_CAP)
+
+    def cost_fn(i, columns):
+        return pitch_cost(i, columns) + RHYTHM_WEIGHT * rhythm_cost(i, columns) + TIME_WEIGHT * time_cost(i, columns)
+
+    path, total = banded_dtw(cost_fn, n_reference, n_take, band)
+
+    # The warping path may repeat a note on either side; keep the cheapest pairing of each
+    costs = cost_fn(path[:, 0], path[:, 1])
+    order = np.argsort(costs, kind='stable')
+    used_reference = np.zeros(n_reference, dtype=bool)
+    used_take = np.zeros(n_take, dtype=bool)
+    keep = []
+    for k in order:
+        i, j = path[k]
+        if used_reference[i] or used_take[j]:
+            continue
+        used_reference[i] = used_take[j] = True
+        keep.append(k)
+    pairs = path[np.sort(keep)] if keep else np.zeros((0, 2), dtype=int)
+
+    return {
+        "reference_notes": pairs[:, 0],
+        "take_notes": pairs[:, 1],
+        "missing": np.flatnonzero(~used_reference),
+        "extra": np.flatnonzero(~used_take),
+        "cost": total,
+    }
+
+
+def align_take(reference, user_file, band=BAND_NOTES):
+    # One alignment per comparison; the scorers take it through their alignment argument
+    reference = load_reference(reference)
+    user = extract_features(user_file, ('onset_times', 'note_pitches'))
+    return align_notes(reference["onset_times"], reference["note_midi"],
+                       user["onset_times"], hz_to_midi(user["note_pitches"]), band)
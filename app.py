@@ -1,24 +1,39 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, url_for
+# Imported first: it points numba's on-disk cache somewhere persistent before librosa loads
+from warmup import is_ready, readiness, start_warmup
 import numpy as np
-import librosa
+import io
 import os
+from audio_cache import file_hash
+from features import ANALYSIS_VERSION, extract_features
+from matching import midi_index, within_tolerance
+from jobs import JobPool, QueueFull
+from live import LiveSessions
+from metrics import collect_breakdown, increment, render_prometheus, timed
+from reference import TEMPLATE_VERSION, load_reference, load_template, template_id
+from result_cache import ResultCache, result_key
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+job_pool = JobPool()
+result_cache = ResultCache()
+
+PITCH_TOLERANCE = 0.5  # semitones between a reference note and the closest take note
+TIMING_TOLERANCE = 0.2  # fraction of the mean reference inter-onset interval
+live_sessions = LiveSessions()
 
 def calculate_pitch_accuracy(original_file, user_file):
     def detect_pitch_yin(audio_file):
-        y, sr = librosa.load(audio_file)
-        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-        pitches = [pitch for pitch in pitches[magnitudes > 0] if pitch > 0]
-        return pitches
+        # One YIN estimate per detected note rather than every voiced piptrack bin
+        note_pitches = extract_features(audio_file, ('note_pitches',))['note_pitches']
+        return note_pitches[~np.isnan(note_pitches)]
     
     def calculate_pitch_score(original_pitches, user_pitches):
-        threshold = 0.3
-        correct_notes = 0
+        threshold = PITCH_TOLERANCE
+        if len(user_pitches) == 0:
+            return 0.0
         
-        for orig_pitch in original_pitches:
-            if any(abs(orig_pitch - user_pitch) < threshold for user_pitch in user_pitches):
-                correct_notes += 1
+        correct_notes = int(np.count_nonzero(within_tolerance(original_pitches, midi_index(user_pitches), threshold)))
         
         total_notes = len(original_pitches)
         if total_notes == 0:
@@ -29,10 +44,11 @@ def calculate_pitch_accuracy(original_file, user_file):
         
         return pitch_accuracy
     
-    original_pitches = detect_pitch_yin(original_file)
+    original_pitches = load_reference(original_file)["note_midi"]
+    original_pitches = original_pitches[~np.isnan(original_pitches)]
     user_pitches = detect_pitch_yin(user_file)
     
-    if not original_pitches:
+    if len(original_pitches) == 0:
         return {"pitch_accuracy": 0.0}
     
     pitch_accuracy = calculate_pitch_score(original_pitches, user_pitches)
@@ -41,10 +57,7 @@ def calculate_pitch_accuracy(original_file, user_file):
 
 def calculate_timing_accuracy(original_file, user_file):
     def detect_onsets(audio_file):
-        y, sr = librosa.load(audio_file)
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-        return onsets
+        return extract_features(audio_file, ('onset_frames',))['onset_frames']
     
     def calculate_timing_score(original_onsets, user_onsets):
         if original_onsets.size == 0 or user_onsets.size == 0:
@@ -56,7 +69,7 @@ def calculate_timing_accuracy(original_file, user_file):
         original_diffs = np.diff(original_onsets)
         tempo = np.mean(original_diffs) if len(original_diffs) > 0 else 1
         
-        threshold = tempo * 0.2
+        threshold = tempo * TIMING_TOLERANCE
         
         correct_timing = 0
         
@@ -74,7 +87,7 @@ def calculate_timing_accuracy(original_file, user_file):
         
         return timing_accuracy
     
-    original_onsets = detect_onsets(original_file)
+    original_onsets = load_reference(original_file)["onset_frames"]
     user_onsets = detect_onsets(user_file)
     
     timing_accuracy = calculate_timing_score(np.array(original_onsets), np.array(user_onsets))
@@ -85,35 +98,171 @@ def calculate_timing_accuracy(original_file, user_file):
 def home():
     return render_template('index.html')
 
+def score_take(reference, user_file):
+    # One decode and one STFT of the take feed both scorers
+    user_file = extract_features(user_file, ('note_pitches', 'onset_frames'))
+    with timed("scoring"):
+        pitch_result = calculate_pitch_accuracy(reference, user_file)
+        timing_result = calculate_timing_accuracy(reference, user_file)
+
+    return {
+        'pitch_accuracy': pitch_result['pitch_accuracy'],
+        'timing_accuracy': timing_result['timing_accuracy']
+    }
+
+def run_scoring_job(reference, user_audio):
+    # Runs in a worker process: the reference is a template id or the raw reference upload
+    if isinstance(reference, str):
+        reference = load_template(reference)
+    else:
+        reference = load_reference(io.BytesIO(reference))
+    return score_take(reference, io.BytesIO(user_audio))
+
 @app.route('/calculate', methods=['POST'])
 def calculate():
+    # Werkzeug keeps small uploads in memory and spools large ones to anonymous temp
+    # files, so requests never share a path; closing the uploads releases both kinds
+    with timed("upload"):
+        uploads = list(request.files.values())
     try:
-        original_file = request.files['original_file']
-        user_file = request.files['user_file']
-        
-        original_path = "temp_original.wav"
-        user_path = "temp_user.wav"
-        
-        original_file.save(original_path)
-        user_file.save(user_path)
-        
-        pitch_result = calculate_pitch_accuracy(original_path, user_path)
-        timing_result = calculate_timing_accuracy(original_path, user_path)
-        
-        result = {
-            'pitch_accuracy': pitch_result['pitch_accuracy'],
-            'timing_accuracy': timing_result['timing_accuracy']
-        }
-        
-        # Clean up temporary files
-        os.remove(original_path)
-        os.remove(user_path)
+        with collect_breakdown() as breakdown, timed("request"):
+            user_file = request.files['user_file'].stream
+
+            # A compiled reference template can be named instead of uploading the reference recording
+            if 'reference_id' in request.form:
+                reference_key = request.form['reference_id']
+            else:
+                reference_key = template_id(request.files['original_file'].stream)
 
+            # Resubmitted takes are answered from the cache without decoding anything
+            key = result_key(reference_key, file_hash(user_file), [ANALYSIS_VERSION, TEMPLATE_VERSION],
+                             [PITCH_TOLERANCE, TIMING_TOLERANCE])
+            result = result_cache.get(key)
+            if result is not None:
+                increment("result_cache_hit")
+                result['cached'] = True
+            else:
+                increment("result_cache_miss")
+                if 'reference_id' in request.form:
+                    reference = load_template(request.form['reference_id'])
+                else:
+                    reference = load_reference(request.files['original_file'].stream)
+
+                result = score_take(reference, user_file)
+                result_cache.set(key, result)
+                result['cached'] = False
+
+        if request.args.get('timings'):
+            result['timings'] = {stage: round(seconds, 4) for stage, seconds in breakdown.items()}
         return jsonify(result)
     
     except Exception as e:
+        increment("request_error")
         print(f"Error occurred: {e}")
         return jsonify({"error": str(e)}), 500
 
+    finally:
+        for upload in uploads:
+            upload.close()
+
+@app.route('/live', methods=['POST'])
+def start_live_session():
+    # Sessions live in this process, so a multi-worker deployment needs sticky routing for /live
+    uploads = list(request.files.values())
+    try:
+        if 'reference_id' in request.form:
+            reference = load_template(request.form['reference_id'])
+        else:
+            reference = load_reference(request.files['original_file'].stream)
+
+        sample_rate = int(request.form.get('sample_rate', 44100))
+        sample_format = request.form.get('format', 's16')
+        session_id = live_sessions.start(reference, sample_rate, sample_format)
+        return jsonify({"session_id": session_id, "chunk_url": url_for('push_live_chunk', session_id=session_id)}), 201
+
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return jsonify({"error": str(e)}), 400
+
+    finally:
+        for upload in uploads:
+            upload.close()
+
+@app.route('/live/<session_id>/chunk', methods=['POST'])
+def push_live_chunk(session_id):
+    session = live_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "unknown session"}), 404
+    try:
+        with timed("live_chunk"):
+            return jsonify(session.push(request.get_data()))
+    except Exception as e:
+        # A malformed chunk is the client's problem; the session stays open for the next one
+        print(f"Error occurred: {e}")
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/live/<session_id>/finish', methods=['POST'])
+def finish_live_session(session_id):
+    with timed("live_finish"):
+        result = live_sessions.finish(session_id)
+    if result is None:
+        return jsonify({"error": "unknown session"}), 404
+    return jsonify(result)
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    return jsonify(readiness()), 200 if is_ready() else 503
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    uploads = list(request.files.values())
+    try:
+        user_audio = request.files['user_file'].read()
+        if 'reference_id' in request.form:
+            reference = request.form['reference_id']
+        else:
+            reference = request.files['original_file'].read()
+
+        job_id = job_pool.submit(run_scoring_job, reference, user_audio)
+        return jsonify({"job_id": job_id, "status_url": url_for('job_status', job_id=job_id)}), 202
+
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        for upload in uploads:
+            upload.close()
+
+@app.route('/jobs/stats')
+def job_stats():
+    return jsonify(job_pool.stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = job_pool.status(job_id)
+    if status is None:
+        return jsonify({"error": "unknown job"}), 404
+    if status["status"] == "done":
+        status["result"] = job_pool.result(job_id)
+    return jsonify(status)
+
+# Kept at the end of the module: forked workers unpickle job functions by name from this module, so it has
+# to be fully defined first. The workers are forked before the warm-up thread exists; /readyz reports 503
+# until the warm-up has finished.
+job_pool.start()
+start_warmup()
+
 if __name__ == '__main__':
     app.run(debug=True)
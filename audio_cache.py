@@ -0,0 +1,237 @@
+import hashlib
+import os
+import struct
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import librosa
+
+from metrics import increment, timed
+
+DEFAULT_SR = 22050
+
+# Decoded audio is kept in memory up to this many bytes (oldest entries are evicted first)
+MAX_MEMORY_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Optional on-disk tier, shared between processes and runs
+CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR")
+
+# (format tag, bits per sample) of the WAV encodings decoded without librosa; 0xFFFE headers carry the tag inside
+_WAV_DTYPES = {(1, 16): np.dtype('<i2'), (3, 32): np.dtype('<f4')}
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_memory_bytes = 0
+_hashes = {}
+_stream_hashes = weakref.WeakKeyDictionary()
+
+
+def _stream_hash(stream):
+    with _lock:
+        digest = _stream_hashes.get(stream)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha1()
+    position = stream.tell()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(1 << 20), b''):
+        sha.update(block)
+    stream.seek(position)
+    digest = sha.hexdigest()
+
+    with _lock:
+        _stream_hashes[stream] = digest
+    return digest
+
+
+def file_hash(audio_file):
+    # Uploads arrive as open binary streams rather than paths
+    if hasattr(audio_file, 'read'):
+        return _stream_hash(audio_file)
+
+    stat = os.stat(audio_file)
+    stamp = (os.path.abspath(audio_file), stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        digest = _hashes.get(stamp)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha1()
+    with open(audio_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    digest = sha.hexdigest()
+
+    with _lock:
+        _hashes[stamp] = digest
+    return digest
+
+
+def _cache_key(digest, sr):
+    return f"{digest}_{sr if sr is not None else 'native'}"
+
+
+def _disk_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.npz")
+
+
+def _remember(key, y, sr):
+    global _memory_bytes
+
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return
+        _memory[key] = (y, sr)
+        _memory_bytes += y.nbytes
+        while _memory_bytes > MAX_MEMORY_BYTES and len(_memory) > 1:
+            _, (old_y, _) = _memory.popitem(last=False)
+            _memory_bytes -= old_y.nbytes
+
+
+def _lookup(key):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            _memory.move_to_end(key)
+        return entry
+
+
+def _load_from_disk(key):
+    if not CACHE_DIR:
+        return None
+    path = _disk_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return data['y'], int(data['sr'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_to_disk(key, y, sr):
+    if not CACHE_DIR:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _disk_path(key)
+    # Write to a unique name first so concurrent processes never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, y=y, sr=sr)
+    os.replace(tmp_path, path)
+
+
+def _wav_layout(f):
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        if chunk_id == b'fmt ':
+            body = f.read(size + size % 2)
+            tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+            if tag == 0xFFFE and size >= 26:
+                tag = struct.unpack('<H', body[24:26])[0]
+            fmt = (_WAV_DTYPES.get((tag, bits)), channels, rate)
+        elif chunk_id == b'data':
+            if fmt is None or fmt[0] is None or fmt[1] == 0:
+                return None
+            return fmt + (f.tell(), size)
+        else:
+            f.seek(size + size % 2, os.SEEK_CUR)
+
+
+def _decode_pcm_wav(audio_file):
+    # Plain PCM/float WAV: map the data chunk and convert to mono float32 in one pass, as librosa would
+    try:
+        if hasattr(audio_file, 'read'):
+            audio_file.seek(0)
+            layout = _wav_layout(audio_file)
+            if layout is None:
+                return None
+            dtype, channels, rate, _, size = layout
+            raw = audio_file.read(size)
+            data = np.frombuffer(raw, dtype=dtype, count=len(raw) // dtype.itemsize)
+        else:
+            with open(audio_file, 'rb') as f:
+                layout = _wav_layout(f)
+            if layout is None:
+                return None
+            dtype, channels, rate, offset, size = layout
+            count = min(size, os.path.getsize(audio_file) - offset) // dtype.itemsize
+            if count <= 0:
+                return None
+            data = np.memmap(audio_file, dtype=dtype, mode='r', offset=offset, shape=(count,))
+    except (OSError, ValueError, struct.error):
+        return None
+
+    frames = len(data) // channels
+    if frames == 0:
+        return None
+    data = data[:frames * channels].reshape(frames, channels)
+
+    scale = np.float32(1 / 32768) if dtype.kind == 'i' else np.float32(1)
+    if channels == 1:
+        y = np.multiply(data[:, 0], scale, dtype=np.float32)
+    else:
+        y = np.multiply(data.sum(axis=1, dtype=np.float32), scale / channels, dtype=np.float32)
+    return y, rate
+
+
+def _decode(audio_file, sr):
+    decoded = _decode_pcm_wav(audio_file)
+    if decoded is None:
+        if hasattr(audio_file, 'seek'):
+            audio_file.seek(0)
+        return librosa.load(audio_file, sr=sr)
+
+    increment("audio_cache_wav_fast_path")
+    y, rate = decoded
+    if sr is not None and sr != rate:
+        # Same resampler librosa.load uses, but only when the rates actually differ
+        y = librosa.resample(y, orig_sr=rate, target_sr=sr)
+        rate = sr
+    return y, rate
+
+
+def load_audio(audio_file, sr=DEFAULT_SR):
+    key = _cache_key(file_hash(audio_file), sr)
+
+    entry = _lookup(key)
+    if entry is not None:
+        increment("audio_cache_memory_hit")
+        return entry
+
+    entry = _load_from_disk(key)
+    if entry is None:
+        increment("audio_cache_miss")
+        with timed("decode"):
+            y, sr = _decode(audio_file, sr)
+        _save_to_disk(key, y, sr)
+    else:
+        increment("audio_cache_disk_hit")
+        y, sr = entry
+
+    # The same array is handed to every caller, so guard it against in-place edits
+    y.flags.writeable = False
+    _remember(key, y, sr)
+    return y, sr
+
+
+def clear_cache():
+    global _memory_bytes
+
+    with _lock:
+        _memory.clear()
+        _memory_bytes = 0
+        _hashes.clear()
@@ -0,0 +1,203 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import timing_accuracy
+from alignment import align_take
+from duration_accuracy import calculate_duration_accuracy
+from export import FORMATS, ROW_GROUP_SIZE, open_writer
+from features import ANALYSIS_VERSION, extract_features
+from metrics import collect_breakdown
+from pitch_accuracy import calculate_adjusted_pitch_accuracy
+from reference import TEMPLATE_VERSION, load_reference
+from tempo import estimate_tempo
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3')
+
+# Pipeline stages (see metrics.timed) reported per take; only those _score_take actually runs
+STAGES = ('decode', 'stft', 'onset', 'tempo', 'pitch_tracking')
+
+SCORE_COLUMNS = [
+    ("file", "string"), ("error", "string"),
+    ("timing_accuracy", "float64"), ("pitch_accuracy", "float64"), ("duration_accuracy", "float64"),
+    ("ref_tempo", "float64"), ("test_tempo", "float64"), ("tempo_accuracy", "float64"), ("seconds", "float64"),
+    ("analysis_version", "int64"), ("template_version", "int64"),
+]
+
+_reference = None
+_timing_reference = None
+_n_fft_values = ()
+
+
+def find_takes(patterns, reference_file=None):
+    takes = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)
+                       if name.lower().endswith(AUDIO_EXTENSIONS)]
+        else:
+            matches = glob.glob(pattern)
+        takes.extend(sorted(matches))
+
+    # The reference often sits next to the takes; never score it against itself
+    if reference_file is not None:
+        reference_path = os.path.abspath(reference_file)
+        takes = [take for take in takes if os.path.abspath(take) != reference_path]
+    return list(dict.fromkeys(takes))
+
+
+def result_columns(n_fft_values=()):
+    return (SCORE_COLUMNS + [(f"{stage}_seconds", "float64") for stage in STAGES]
+            + ([("n_fft_sweep_seconds", "float64")] if n_fft_values else [])
+            + [(f"timing_n_fft_{n_fft}", "float64") for n_fft in n_fft_values])
+
+
+def result_row(result):
+    # One flat record per take, matching result_columns
+    row = {name: value for name, value in result.items() if name not in ("stages", "timing_by_n_fft")}
+    row.update({f"{stage}_seconds": seconds for stage, seconds in result.get("stages", {}).items()})
+    row.update({f"timing_n_fft_{n_fft}": score for n_fft, score in result.get("timing_by_n_fft", {}).items()})
+    row["analysis_version"] = ANALYSIS_VERSION
+    row["template_version"] = TEMPLATE_VERSION
+    return row
+
+
+def _init_worker(reference, timing_reference=None, n_fft_values=()):
+    global _reference, _timing_reference, _n_fft_values
+    _reference = reference
+    _timing_reference = timing_reference
+    _n_fft_values = n_fft_values
+
+
+def score_take(reference, user_file, timing_reference=None, n_fft_values=()):
+    with collect_breakdown() as breakdown:
+        result = _score_take(reference, user_file)
+    result["stages"] = {stage: round(seconds, 4) for stage, seconds in breakdown.items() if stage in STAGES}
+
+    # Optional per-resolution timing scores from the timing_accuracy.py sweep, timed on their own so the
+    # sweep's decode and STFT work does not show up in the stage columns. Batch workers are already one
+    # per core, so the sweep runs in-process rather than starting a pool of its own.
+    if n_fft_values:
+        started = time.perf_counter()
+        scores, _ = timing_accuracy.score_against_original(timing_reference, user_file, n_fft_values,
+                                                           timing_accuracy.threshold, workers=1)
+        result["timing_by_n_fft"] = {n_fft: float(score) for n_fft, score in zip(n_fft_values, scores)}
+        result["n_fft_sweep_seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _score_take(reference, user_file):
+    file_name = user_file
+    started = time.perf_counter()
+    # Decode and analyse the take once; every scorer below reads from this bundle
+    user_file = extract_features(user_file, ('onset_frames', 'onset_times', 'note_pitches', 'tempo'))
+    # The note correspondence is computed once and shared by every note-level scorer
+    alignment = align_take(reference, user_file)
+
+    result = calculate_adjusted_pitch_accuracy(reference, user_file, alignment)
+    duration_result = calculate_duration_accuracy(reference, user_file, alignment)
+    test_tempo = estimate_tempo(user_file, reference["tempo"])
+    ref_tempo = reference["tempo"]
+
+    return {
+        "file": file_name,
+        "timing_accuracy": float(result["timing_accuracy"]),
+        "pitch_accuracy": float(result["pitch_accuracy"]),
+        "duration_accuracy": float(duration_result["duration_accuracy"]),
+        "ref_tempo": ref_tempo,
+        "test_tempo": test_tempo,
+        "tempo_accuracy": 100 - abs((test_tempo - ref_tempo) / ref_tempo * 100),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _score_in_worker(user_file):
+    try:
+        return score_take(_reference, user_file, _timing_reference, _n_fft_values)
+    except Exception as e:
+        # One unreadable or degenerate take must not abort the batch
+        return {"file": user_file, "error": f"{type(e).__name__}: {e}"}
+
+
+def _run_pool(takes, workers, initargs, report):
+    # Returns the takes left unfinished because a worker died and broke the pool
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        futures = {executor.submit(_score_in_worker, take): take for take in takes}
+        for future in as_completed(futures):
+            try:
+                report(future.result())
+            except BrokenProcessPool:
+                unfinished.append(futures[future])
+            except Exception as e:
+                report({"file": futures[future], "error": f"{type(e).__name__}: {e}"})
+    return unfinished
+
+
+def run_batch(reference_file, takes, workers=None, out=sys.stdout, writer=None, n_fft_values=()):
+    # Analyze the reference once in the parent and hand the template to every worker
+    reference = load_reference(reference_file)
+    if writer is None:
+        writer = open_writer('jsonl', out=out)
+    # The sweep's reference onsets likewise, rather than once per take
+    timing_reference = timing_accuracy.analyze_original(reference_file, n_fft_values) if n_fft_values else None
+    initargs = (reference, timing_reference, tuple(n_fft_values))
+
+    failures = 0
+
+    def report(result):
+        nonlocal failures
+        if "error" in result:
+            failures += 1
+        writer.write(result_row(result))
+
+    # A worker that dies outright (segfault, killed for memory) breaks the whole pool and every take still
+    # queued on it. Those takes get a fresh pool; any that break it again are run one per pool, so only
+    # the take that actually crashes is reported as failed.
+    unfinished = _run_pool(takes, workers, initargs, report)
+    if unfinished:
+        unfinished = _run_pool(unfinished, workers, initargs, report)
+    for take in unfinished:
+        if _run_pool([take], 1, initargs, report):
+            report({"file": take, "error": "BrokenProcessPool: worker process died while scoring this take"})
+
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a directory or glob of takes against one reference.")
+    parser.add_argument("reference", help="reference recording or compiled reference template (.npz)")
+    parser.add_argument("takes", nargs="+", help="take files, directories or glob patterns")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--format", choices=FORMATS, default='jsonl',
+                        help="jsonl (default), or columnar parquet/arrow/csv; those need --output")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE,
+                        help="takes buffered per columnar write")
+    parser.add_argument("--n-fft-sweep", action="store_true",
+                        help="also record the timing_accuracy.py score at every n_fft")
+    args = parser.parse_args(argv)
+
+    if args.format != 'jsonl' and not args.output:
+        parser.error(f"--format {args.format} needs --output")
+    if args.n_fft_sweep and args.reference.endswith('.npz'):
+        parser.error("--n-fft-sweep needs the reference recording, not a compiled template")
+
+    n_fft_values = timing_accuracy.n_fft_values if args.n_fft_sweep else ()
+    takes = find_takes(args.takes, args.reference)
+    writer = open_writer(args.format, args.output, result_columns(n_fft_values), args.row_group_size)
+    try:
+        failures = run_batch(args.reference, takes, args.workers, writer=writer, n_fft_values=n_fft_values)
+    finally:
+        writer.close()
+
+    print(f"Scored {len(takes) - failures}/{len(takes)} takes ({failures} failed)", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import check
+import feature_store
+import timing_accuracy
+from audio_cache import clear_cache, load_audio
+from duration_accuracy import calculate_duration_accuracy
+from features import FEATURES, extract_features
+from pitch_accuracy import calculate_adjusted_pitch_accuracy
+from reference import compile_reference
+from tempo import estimate_tempo
+
+REFERENCE_FILE = 'Original_32_notes.wav'
+
+CORPUS = [
+    '3_extra_notes_2_off_pitch_1_off_timing (2).wav',
+    '5_notes_high_volume.wav',
+    '5_notes_missing (1).wav',
+    '5_notes_off_pitch (3).wav',
+    '5_notes_off_pitch_5_high_v (2).wav',
+    '5_notes_off_time.wav',
+    '7.wav',
+    '8_notes_longer_hold (1).wav',
+    '8.5.wav',
+    '9.5.wav',
+    '10_notes_high_tempo.wav',
+    '10_notes_high_tempo0_notes_low_tempo.wav',
+    '10_notes_low_volume.wav',
+    '10_notes_mixed_volume.wav',
+    '10_notes_off_time.wav',
+    '10_notes_staccato (2).wav'
+]
+
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# A stage regresses when it is this much slower than the baseline (and slower by at least MIN_SLOWDOWN seconds)
+TIME_TOLERANCE = 0.25
+MIN_SLOWDOWN = 0.05
+
+# Any score further than this from the baseline counts as drift
+SCORE_TOLERANCE = 1e-6
+
+
+def run_stage(stages, name, fn, *args):
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - start_memory
+    stages[name] = {"seconds": round(seconds, 4), "peak_mb": round(peak / 2**20, 2)}
+    return result
+
+
+def benchmark_take(reference, take):
+    stages = {}
+    scores = {}
+
+    run_stage(stages, "decode", load_audio, take)
+    run_stage(stages, "features", extract_features, take, FEATURES)
+
+    result = run_stage(stages, "pitch", calculate_adjusted_pitch_accuracy, reference, take)
+    scores["pitch_accuracy"] = float(result["pitch_accuracy"])
+
+    _, final_timing = run_stage(stages, "timing", timing_accuracy.main, REFERENCE_FILE, take,
+                                timing_accuracy.n_fft_values, timing_accuracy.threshold)
+    scores["timing_accuracy"] = float(final_timing)
+
+    result = run_stage(stages, "duration", calculate_duration_accuracy, reference, take)
+    scores["duration_accuracy"] = float(result["duration_accuracy"])
+
+    scores["tempo"] = run_stage(stages, "tempo", estimate_tempo, take, reference["tempo"])
+
+    _, _, average_pitch, average_dynamics = run_stage(
+        stages, "dynamics", check.calculate_pitch_and_dynamics_accuracy, REFERENCE_FILE, take,
+        check.n_fft_values_pitch, check.n_fft_values_dynamics, check.pitch_tolerance,
+        check.dynamics_tolerance_for_pitch, check.dynamics_tolerance, check.pitch_tolerance_for_dynamics)
+    scores["sweep_pitch_accuracy"] = float(average_pitch)
+    scores["dynamics_accuracy"] = float(average_dynamics)
+
+    return {"stages": stages, "scores": scores}
+
+
+def run_benchmark(takes):
+    clear_cache()
+    # Stored features would turn the analysis stages into disk reads after the first run
+    store_dir, feature_store.STORE_DIR = feature_store.STORE_DIR, None
+    tracemalloc.start()
+    try:
+        reference_stages = {}
+        _, reference = run_stage(reference_stages, "reference", compile_reference, REFERENCE_FILE)
+        results = {"reference": {"stages": reference_stages, "scores": {}}}
+        for take in takes:
+            results[take] = benchmark_take(reference, take)
+            print(f"{take}: {sum(stage['seconds'] for stage in results[take]['stages'].values()):.2f}s",
+                  file=sys.stderr)
+    finally:
+        tracemalloc.stop()
+        feature_store.STORE_DIR = store_dir
+    return results
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, score_tolerance=SCORE_TOLERANCE):
+    flags = []
+    for take, result in results.items():
+        expected = baseline.get(take)
+        if expected is None:
+            continue
+
+        for stage, measured in result["stages"].items():
+            before = expected["stages"].get(stage)
+            if before is None:
+                continue
+            slowdown = measured["seconds"] - before["seconds"]
+            if slowdown > MIN_SLOWDOWN and measured["seconds"] > before["seconds"] * (1 + time_tolerance):
+                flags.append(f"SLOWER  {take} [{stage}] {before['seconds']:.3f}s -> {measured['seconds']:.3f}s")
+
+        for metric, score in result["scores"].items():
+            before = expected["scores"].get(metric)
+            if before is not None and abs(score - before) > score_tolerance:
+                flags.append(f"DRIFT   {take} [{metric}] {before} -> {score}")
+
+    return flags
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every metric over the bundled WAV corpus.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--output", help="also write this run's results here")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--score-tolerance", type=float, default=SCORE_TOLERANCE)
+    parser.add_argument("takes", nargs="*", default=CORPUS)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.takes)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    flags = compare(results, baseline, args.time_tolerance, args.score_tolerance)
+    for flag in flags:
+        print(flag)
+    print(f"{len(flags)} regression(s) against {args.baseline}")
+    return 1 if flags else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,10 @@
 import numpy as np
-import librosa
+from features import extract_features
+from reference import load_reference
 
-def calculate_duration_accuracy(original_file, user_file):
+def calculate_duration_accuracy(original_file, user_file, alignment=None):
     def detect_durations(audio_file):
-        y, sr = librosa.load(audio_file)
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, units='time')
+        onsets = extract_features(audio_file, ('onset_times',))['onset_times']
         
         # Compute durations between onsets
         durations = np.diff(onsets)
@@ -44,18 +43,42 @@ def calculate_duration_accuracy(original_file, user_file):
         
         return duration_accuracy, percentage_diffs
 
+    def calculate_aligned_duration_score(original_durations, user_durations, alignment):
+        if len(original_durations) == 0 or len(user_durations) == 0:
+            return 0.0, []
+
+        threshold = 0.2
+
+        # Compare the interval after each aligned note with the interval after its partner
+        reference_notes, take_notes = alignment["reference_notes"], alignment["take_notes"]
+        paired = (reference_notes < len(original_durations)) & (take_notes < len(user_durations))
+        reference_notes, take_notes = reference_notes[paired], take_notes[paired]
+        differences = np.abs(original_durations[reference_notes] - user_durations[take_notes])
+        correct = differences <= threshold
+
+        percentage_diffs = np.ones(len(original_durations))
+        percentage_diffs[reference_notes[correct]] = differences[correct] / original_durations[reference_notes[correct]]
+
+        duration_accuracy = round(np.count_nonzero(correct) / len(original_durations) * 10, 1)
+        return duration_accuracy, percentage_diffs
+
     # Detect durations
-    original_durations = detect_durations(original_file)
+    original_durations = load_reference(original_file)["inter_onset_intervals"]
     user_durations = detect_durations(user_file)
 
     # Calculate duration accuracy score
-    duration_accuracy, percentage_diffs = calculate_duration_score(np.array(original_durations), np.array(user_durations))
+    if alignment is not None:
+        duration_accuracy, percentage_diffs = calculate_aligned_duration_score(
+            np.array(original_durations), np.array(user_durations), alignment)
+    else:
+        duration_accuracy, percentage_diffs = calculate_duration_score(np.array(original_durations), np.array(user_durations))
     
     return {
         "duration_accuracy": duration_accuracy,
         "percentage_diffs": np.array(percentage_diffs)
     }
 
-# Example usage
-results = calculate_duration_accuracy('Original_32_notes.wav', '8.5.wav')
-print(results)
+if __name__ == '__main__':
+    # Example usage
+    results = calculate_duration_accuracy('Original_32_notes.wav', '8.5.wav')
+    print(results)
@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+import sys
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATS = ('jsonl', 'parquet', 'arrow', 'csv')
+
+# Rows are buffered and written this many at a time, so a run never holds all of its results
+ROW_GROUP_SIZE = 512
+
+
+class JsonLinesWriter:
+    def __init__(self, out=sys.stdout, close_out=False):
+        self.out = out
+        self.close_out = close_out
+
+    def write(self, row):
+        self.out.write(json.dumps(row) + "\n")
+        self.out.flush()
+
+    def close(self):
+        if self.close_out:
+            self.out.close()
+
+
+class ColumnarWriter:
+    # columns: (name, type) pairs with type one of "string", "float64", "int64"
+    def __init__(self, path, fmt, columns, row_group_size=ROW_GROUP_SIZE):
+        if fmt in ('parquet', 'arrow') and pa is None:
+            path = os.path.splitext(path)[0] + '.csv'
+            print(f"pyarrow is not installed; writing CSV to {path} instead", file=sys.stderr)
+            fmt = 'csv'
+
+        self.path = path
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.row_group_size = row_group_size
+        self._rows = []
+        self._file = None
+        self._writer = None
+
+        if fmt == 'csv':
+            self._file = open(path, 'w', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=[name for name, _ in self.columns],
+                                          extrasaction='ignore')
+            self._writer.writeheader()
+        else:
+            self._schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in self.columns])
+            if fmt == 'parquet':
+                self._writer = pq.ParquetWriter(path, self._schema)
+            else:
+                self._file = pa.OSFile(path, 'wb')
+                self._writer = pa.ipc.new_file(self._file, self._schema)
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        if self.fmt == 'csv':
+            self._writer.writerows(self._rows)
+            self._file.flush()
+        else:
+            table = pa.Table.from_pydict({name: [row.get(name) for row in self._rows] for name, _ in self.columns},
+                                         schema=self._schema)
+            # One call per buffer: each flush becomes its own Parquet row group / IPC record batch
+            self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        if self.fmt != 'csv':
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def open_writer(fmt, path=None, columns=(), row_group_size=ROW_GROUP_SIZE, out=sys.stdout):
+    if fmt == 'jsonl':
+        return JsonLinesWriter(open(path, 'w'), close_out=True) if path else JsonLinesWriter(out)
+    if not path:
+        raise ValueError(f"{fmt} output needs a file path")
+    return ColumnarWriter(path, fmt, columns, row_group_size)
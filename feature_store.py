@@ -0,0 +1,56 @@
+import os
+import threading
+
+import numpy as np
+
+# One directory per recording and analysis configuration, one .npy per feature. Off unless
+# FEATURE_STORE_DIR is set: nothing evicts entries, so it suits a fixed corpus rather than uploads.
+STORE_DIR = os.environ.get("FEATURE_STORE_DIR")
+
+# Stored as one-element arrays and handed back as plain numbers
+SCALAR_FEATURES = ('sr', 'hop_length', 'tempo')
+
+
+def entry_dir(digest, params):
+    sr, n_fft, hop_length, version = params
+    return os.path.join(STORE_DIR, digest[:2], digest, f"v{version}_sr{sr}_nfft{n_fft}_hop{hop_length}")
+
+
+def _read(path):
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        # Empty arrays cannot be memory-mapped
+        return np.load(path)
+
+
+def read_features(digest, params, features):
+    if not STORE_DIR:
+        return {}
+
+    directory = entry_dir(digest, params)
+    stored = {}
+    for feature in tuple(features) + SCALAR_FEATURES:
+        path = os.path.join(directory, f"{feature}.npy")
+        if feature in stored or not os.path.exists(path):
+            continue
+        try:
+            value = _read(path)
+        except (OSError, ValueError):
+            continue
+        stored[feature] = value.item() if feature in SCALAR_FEATURES else value
+    return stored
+
+
+def write_features(digest, params, bundle):
+    if not STORE_DIR:
+        return
+
+    directory = entry_dir(digest, params)
+    os.makedirs(directory, exist_ok=True)
+    for feature, value in bundle.items():
+        path = os.path.join(directory, f"{feature}.npy")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.atleast_1d(value) if feature in SCALAR_FEATURES else np.asarray(value))
+        os.replace(tmp_path, path)
@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import librosa
+
+from audio_cache import DEFAULT_SR, file_hash, load_audio
+from feature_store import read_features, write_features
+from metrics import timed
+from spectrogram import extract_frame_peaks
+
+FEATURES = ('onset_envelope', 'onset_frames', 'onset_times', 'note_pitches', 'pitch_track', 'pitch_frames',
+            'peak_amplitudes', 'voiced_pitches', 'rms', 'tempo', 'tempo_curve')
+
+# Note segments are cut at the next onset, and never run longer than this (skips trailing silence)
+NOTE_MAX_SECONDS = 2.0
+YIN_FMIN = 65.0  # C2
+YIN_FMAX = 2093.0  # C7
+
+# Local tempo: autocorrelation window in onset frames (about 9 s at 22050 Hz / 512) and the BPM range searched
+TEMPOGRAM_WINDOW = 384
+MIN_BPM = 30.0
+MAX_BPM = 300.0
+
+MAX_CACHED_BUNDLES = 64
+
+# Bump whenever compute_features changes what it produces, so stored features are recomputed
+ANALYSIS_VERSION = 2
+
+_lock = threading.Lock()
+_bundles = OrderedDict()
+
+
+def estimate_global_tempo(median_onset_env, sr, hop_length):
+    # Same smoothing and beat tracker as tempo.estimate_tempo
+    onset_env = np.convolve(median_onset_env, np.ones(10)/10, mode='same')
+    tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+    return float(np.atleast_1d(tempo)[0])
+
+
+def estimate_tempo_curve(onset_env, sr, hop_length, win_length=TEMPOGRAM_WINDOW):
+    # Strongest tempogram lag per onset frame
+    tempogram = librosa.feature.tempogram(onset_envelope=onset_env, sr=sr, hop_length=hop_length,
+                                          win_length=win_length)
+    bpms = librosa.tempo_frequencies(tempogram.shape[0], sr=sr, hop_length=hop_length)
+    usable = (bpms >= MIN_BPM) & (bpms <= MAX_BPM)
+    return bpms[usable][tempogram[usable].argmax(axis=0)]
+
+
+def estimate_note_pitches(y, sr, onset_samples, frame_length=2048, hop_length=512):
+    # One YIN estimate per note, computed only over that note's own samples
+    onset_samples = np.asarray(onset_samples, dtype=int)
+    ends = np.append(onset_samples[1:], len(y))
+    ends = np.minimum(ends, onset_samples + int(NOTE_MAX_SECONDS * sr))
+
+    note_pitches = np.full(len(onset_samples), np.nan)
+    for i, (start, end) in enumerate(zip(onset_samples, ends)):
+        if end - start < hop_length:
+            continue
+        f0 = librosa.yin(y[start:end], fmin=YIN_FMIN, fmax=YIN_FMAX, sr=sr,
+                         frame_length=frame_length, hop_length=hop_length)
+        note_pitches[i] = np.median(f0)
+    return note_pitches
+
+
+def compute_features(y, sr, features, n_fft=2048, hop_length=512):
+    bundle = {}
+    features = set(features)
+
+    # Every feature derives from this one magnitude STFT, directly or through its mel projection
+    if features:
+        with timed("stft"):
+            S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+
+    if features & {'onset_envelope', 'onset_frames', 'onset_times', 'note_pitches', 'tempo', 'tempo_curve'}:
+        with timed("onset"):
+            # onset_strength(y=...) builds exactly this log-power mel spectrogram internally
+            mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=S**2, sr=sr, n_fft=n_fft, hop_length=hop_length))
+
+            if features & {'onset_envelope', 'onset_frames', 'onset_times', 'note_pitches', 'tempo_curve'}:
+                onset_env = librosa.onset.onset_strength(S=mel_db, sr=sr, n_fft=n_fft, hop_length=hop_length)
+                onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+                bundle['onset_envelope'] = onset_env
+                bundle['onset_frames'] = onset_frames
+                bundle['onset_times'] = librosa.frames_to_time(onset_frames, sr=sr, hop_length=hop_length)
+
+        if 'tempo' in features:
+            with timed("tempo"):
+                median_env = librosa.onset.onset_strength(S=mel_db, sr=sr, n_fft=n_fft, hop_length=hop_length,
+                                                          aggregate=np.median)
+                bundle['tempo'] = estimate_global_tempo(median_env, sr, hop_length)
+
+        if 'tempo_curve' in features:
+            with timed("tempo"):
+                bundle['tempo_curve'] = estimate_tempo_curve(bundle['onset_envelope'], sr, hop_length)
+
+    if 'note_pitches' in features:
+        with timed("pitch_tracking"):
+            onset_samples = librosa.frames_to_samples(bundle['onset_frames'], hop_length=hop_length)
+            bundle['note_pitches'] = estimate_note_pitches(y, sr, onset_samples, n_fft, hop_length)
+
+    if features & {'pitch_track', 'pitch_frames', 'peak_amplitudes', 'voiced_pitches'}:
+        with timed("pitch_tracking"):
+            pitches, magnitudes = librosa.core.piptrack(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)
+            bundle['pitch_track'], bundle['peak_amplitudes'], bundle['pitch_frames'] = extract_frame_peaks(
+                pitches, magnitudes, return_frames=True)
+            voiced_pitches = pitches[magnitudes > 0]
+            bundle['voiced_pitches'] = voiced_pitches[voiced_pitches > 0]
+
+    if 'rms' in features:
+        with timed("rms"):
+            # From the samples, not S: rms(S=...) assumes a window-normalized STFT and reads about 0.6x lower,
+            # which would shift every loudness comparison tuned against the time-domain values
+            bundle['rms'] = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)[0]
+
+    return bundle
+
+
+def extract_features(audio_file, features=FEATURES, sr=DEFAULT_SR, n_fft=2048, hop_length=512):
+    # A bundle that already carries the requested features is passed straight through
+    if isinstance(audio_file, dict):
+        missing = [feature for feature in features if feature not in audio_file]
+        if missing:
+            raise ValueError(f"Feature bundle is missing {', '.join(missing)}")
+        return audio_file
+
+    digest = file_hash(audio_file)
+    key = (digest, sr, n_fft, hop_length)
+    with _lock:
+        bundle = _bundles.get(key)
+        if bundle is not None:
+            _bundles.move_to_end(key)
+            bundle = dict(bundle)
+
+    if bundle is None:
+        bundle = {}
+    missing = [feature for feature in features if feature not in bundle]
+    if missing:
+        # The on-disk store serves whatever was computed by an earlier run; only the rest needs decoding
+        params = (sr, n_fft, hop_length, ANALYSIS_VERSION)
+        bundle.update(read_features(digest, params, missing))
+        missing = [feature for feature in features if feature not in bundle]
+        if missing:
+            y, rate = load_audio(audio_file, sr=sr)
+            computed = compute_features(y, rate, missing, n_fft, hop_length)
+            computed['sr'] = rate
+            computed['hop_length'] = hop_length
+            write_features(digest, params, computed)
+            bundle.update(computed)
+
+        with _lock:
+            _bundles[key] = bundle
+            _bundles.move_to_end(key)
+            while len(_bundles) > MAX_CACHED_BUNDLES:
+                _bundles.popitem(last=False)
+
+    return bundle
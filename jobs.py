@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+WORKERS = int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 1))
+
+# Submissions beyond this many unfinished jobs are rejected instead of piling up
+MAX_PENDING = int(os.environ.get("JOB_QUEUE_LIMIT", 64))
+
+# Finished jobs are kept around for polling until there are more than this many
+MAX_FINISHED = int(os.environ.get("JOB_HISTORY_LIMIT", 1000))
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _timed_call(fn, args):
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+class JobPool:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, max_finished=MAX_FINISHED):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_run_seconds = 0.0
+        self._total_wait_seconds = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def start(self):
+        # Forks the workers now rather than on the first job, so it can happen before the process starts
+        # any threads whose locks a forked child would inherit held
+        with self._lock:
+            executor = self._get_executor()
+        executor.submit(int).result()
+
+    def _replace_executor(self, broken):
+        # Every job in flight reports the same broken pool; only the first one replaces it
+        if self._executor is broken:
+            self._executor = None
+            broken.shutdown(wait=False)
+        return self._get_executor()
+
+    def _submit_call(self, executor, call):
+        try:
+            return executor.submit(_timed_call, *call), executor
+        except BrokenProcessPool:
+            executor = self._replace_executor(executor)
+            return executor.submit(_timed_call, *call), executor
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} jobs already pending")
+            submitted = time.time()
+            future, executor = self._submit_call(self._get_executor(), (fn, args))
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"status": "queued", "submitted": submitted, "started": None,
+                                  "finished": None, "result": None, "error": None, "future": future,
+                                  "executor": executor, "call": (fn, args), "crashes": 0}
+            self._pending += 1
+
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _finish(self, job_id, future):
+        retry = None
+        with self._lock:
+            job = self._jobs[job_id]
+            executor = job.pop("executor")
+            if isinstance(future.exception(), BrokenProcessPool) and job["crashes"] < 2:
+                # A dead worker fails every job still on its pool. Retry them on a fresh pool, and a job
+                # that breaks that one too alone in a pool of its own, so only the job that crashes fails.
+                job["crashes"] += 1
+                target = self._replace_executor(executor) if job["crashes"] == 1 else ProcessPoolExecutor(max_workers=1)
+                retry, job["executor"] = self._submit_call(target, job["call"])
+                job["future"] = retry
+            else:
+                job.pop("future", None)
+                job.pop("call", None)
+                self._pending -= 1
+                try:
+                    job["result"], job["started"], job["finished"] = future.result()
+                    job["status"] = "done"
+                    self._completed += 1
+                    self._total_run_seconds += job["finished"] - job["started"]
+                    self._total_wait_seconds += job["started"] - job["submitted"]
+                except Exception as e:
+                    job["status"] = "failed"
+                    job["error"] = str(e)
+                    job["finished"] = time.time()
+                    self._failed += 1
+                self._trim()
+            if executor is not self._executor:
+                # Single-job pools, and shared pools that have already been replaced
+                executor.shutdown(wait=False)
+
+        if retry is not None:
+            retry.add_done_callback(lambda f: self._finish(job_id, f))
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job["status"]
+            future = job.get("future")
+            # Handed to a worker's call queue; the worker may not have picked it up yet
+            if status == "queued" and future is not None and future.running():
+                status = "dispatched"
+
+            info = {"id": job_id, "status": status, "submitted": job["submitted"]}
+            if job["started"] is not None:
+                info["wait_seconds"] = round(job["started"] - job["submitted"], 3)
+                info["run_seconds"] = round(job["finished"] - job["started"], 3)
+            if job["error"] is not None:
+                info["error"] = job["error"]
+            return info
+
+    def result(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else job["result"]
+
+    def stats(self):
+        with self._lock:
+            dispatched = sum(1 for job in self._jobs.values()
+                             if job.get("future") is not None and job["future"].running())
+            completed = self._completed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "queued": self._pending - dispatched,
+                "dispatched": dispatched,
+                "completed": completed,
+                "failed": self._failed,
+                "avg_run_seconds": round(self._total_run_seconds / completed, 3) if completed else None,
+                "avg_wait_seconds": round(self._total_wait_seconds / completed, 3) if completed else None,
+            }
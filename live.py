@@ -0,0 +1,122 @@
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from matching import hz_to_midi, match_nearest, midi_index, within_tolerance
+from streaming import StreamingAnalyzer
+
+# Semitones between a take frame and the closest reference frame for the frame to count as in tune
+PITCH_TOLERANCE = 0.5
+
+# Fraction of the reference inter-onset interval a take onset may be off by
+TIMING_TOLERANCE = 0.2
+
+# Sessions that receive nothing for this long are dropped
+SESSION_TIMEOUT = 300
+
+SAMPLE_FORMATS = {"s16": (np.int16, 1 / 32768.0), "f32": (np.float32, 1.0)}
+
+
+class LiveSession:
+    def __init__(self, reference, sample_rate, sample_format="s16"):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format {sample_format!r}")
+
+        self.lock = threading.Lock()
+        self.last_seen = time.time()
+        self.dtype, self.scale = SAMPLE_FORMATS[sample_format]
+        self.pending = b''
+        self.analyzer = StreamingAnalyzer(sample_rate)
+        self.samples_received = 0
+
+        self.reference_onsets = np.asarray(reference["onset_times"])
+        intervals = np.diff(self.reference_onsets)
+        self.timing_threshold = (np.mean(intervals) if len(intervals) > 0 else 1) * TIMING_TOLERANCE
+        self.reference_pitches = midi_index(reference["pitch_track"])
+
+        self.user_onsets = []
+        self.voiced_frames = 0
+        self.in_tune_frames = 0
+
+    def _decode(self, chunk):
+        data = self.pending + chunk
+        usable = len(data) - len(data) % np.dtype(self.dtype).itemsize
+        self.pending = data[usable:]
+        return np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32) * self.scale
+
+    def _consume(self, result):
+        self.user_onsets.extend(result["onset_times"].tolist())
+
+        pitches = result["pitch_track"]
+        if pitches.size:
+            self.voiced_frames += pitches.size
+            self.in_tune_frames += int(np.count_nonzero(
+                within_tolerance(hz_to_midi(pitches), self.reference_pitches, PITCH_TOLERANCE)))
+
+    def scores(self, final=False):
+        elapsed = self.samples_received / self.analyzer.sr
+
+        # Only reference onsets the performer should already have reached count against them
+        expected = self.reference_onsets if final else self.reference_onsets[self.reference_onsets <= elapsed]
+        if expected.size and self.user_onsets:
+            matched, _, _ = match_nearest(expected, self.user_onsets, self.timing_threshold)
+            timing_accuracy = round(matched / expected.size * 10, 1)
+        else:
+            timing_accuracy = 0.0 if final or expected.size else None
+
+        pitch_accuracy = round(self.in_tune_frames / self.voiced_frames * 10, 1) if self.voiced_frames else None
+
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "onsets_detected": len(self.user_onsets),
+            "timing_accuracy": timing_accuracy,
+            "pitch_accuracy": pitch_accuracy,
+            "final": final,
+        }
+
+    def push(self, chunk):
+        with self.lock:
+            self.last_seen = time.time()
+            samples = self._decode(chunk)
+            self.samples_received += len(samples)
+            self._consume(self.analyzer.push(samples))
+            return self.scores()
+
+    def finish(self):
+        with self.lock:
+            self._consume(self.analyzer.finish())
+            return self.scores(final=True)
+
+
+class LiveSessions:
+    def __init__(self, timeout=SESSION_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _expire(self):
+        # Run on every /live call, so abandoned sessions go away even when no new ones are started
+        cutoff = time.time() - self.timeout
+        for session_id in [key for key, session in self._sessions.items() if session.last_seen < cutoff]:
+            del self._sessions[session_id]
+
+    def start(self, reference, sample_rate, sample_format="s16"):
+        session = LiveSession(reference, sample_rate, sample_format)
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = session
+        return session_id
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def finish(self, session_id):
+        with self._lock:
+            self._expire()
+            session = self._sessions.pop(session_id, None)
+        return None if session is None else session.finish()
@@ -1,44 +1,12 @@
 import numpy as np
-import librosa
+from matching import match_nearest
+from spectrogram import compute_resolutions, get_resolution
 
 def get_peak_frequencies(filename, n_fft):
-    y, sr = librosa.load(filename)
-    S = np.abs(librosa.stft(y, n_fft=n_fft))
-    frequencies = librosa.fft_frequencies(sr=sr)
-
-    onset_frames = librosa.onset.onset_detect(y=y, sr=sr, backtrack=True, units='frames', delta=0.01)
-
-    peak_times = []
-    peak_freqs = []
-    peak_amplitudes = []
-
-    for onset_frame in onset_frames:
-        if onset_frame < S.shape[1]:
-            spectrum = np.abs(S[:, onset_frame])
-            peak = np.argmax(spectrum)
-            peak_freq = frequencies[peak]
-            peak_amp = np.max(spectrum)
-            if 50 <= peak_freq <= 1000:
-                peak_time = librosa.frames_to_time(onset_frame, sr=sr)
-                peak_times.append(peak_time)
-                peak_freqs.append(peak_freq)
-                peak_amplitudes.append(peak_amp)
-
-    return np.array(peak_times), np.array(peak_freqs), np.array(peak_amplitudes)
+    return get_resolution(filename, n_fft, ('onset_peaks',))['onset_peaks']
 
 def calculate_pitch_score(detected_freqs, expected_freqs, threshold=0.1, penalize_missing=False):
-    matched = 0
-    unmatched = 0
-
-    for expected in expected_freqs:
-        if len(detected_freqs) == 0:
-            unmatched += 1
-        else:
-            closest_match = min(detected_freqs, key=lambda x: abs(x - expected))
-            if abs(closest_match - expected) <= threshold:
-                matched += 1
-            else:
-                unmatched += 1
+    matched, unmatched, _ = match_nearest(expected_freqs, detected_freqs, threshold)
 
     total = len(expected_freqs)
     
@@ -49,18 +17,7 @@ def calculate_pitch_score(detected_freqs, expected_freqs, threshold=0.1, penaliz
 
     return score, matched, unmatched
 def calculate_dynamics_score(amps1, amps2, amp_tolerance=0.29, penalize_missing=False):
-    matched = 0
-    unmatched = 0
-
-    for amp1 in amps1:
-        if len(amps2) == 0:
-            unmatched += 1
-        else:
-            closest_amp2 = min(amps2, key=lambda x: abs(x - amp1))
-            if abs(closest_amp2 - amp1) <= amp_tolerance:
-                matched += 1
-            else:
-                unmatched += 1
+    matched, unmatched, _ = match_nearest(amps1, amps2, amp_tolerance)
 
     total = len(amps1)
     
@@ -73,18 +30,7 @@ def calculate_dynamics_score(amps1, amps2, amp_tolerance=0.29, penalize_missing=
     
 
 def calculate_time_accuracy(times1, times2, time_tolerance=0.15, penalize_missing=False):
-    matched = 0
-    unmatched = 0
-
-    for time1 in times1:
-        if len(times2) == 0:
-            unmatched += 1
-        else:
-            closest_time2 = min(times2, key=lambda x: abs(x - time1))
-            if abs(closest_time2 - time1) <= time_tolerance:
-                matched += 1
-            else:
-                unmatched += 1
+    matched, unmatched, _ = match_nearest(times1, times2, time_tolerance)
 
     total = len(times1)
     
@@ -105,15 +51,7 @@ def calculate_rhythm_accuracy(times1, times2, grid_tolerance=0.08, penalize_miss
         expected_intervals = np.diff(times1)
         detected_intervals = np.diff(times2)
 
-        for exp_interval in expected_intervals:
-            if len(detected_intervals) == 0:
-                unmatched += 1
-            else:
-                closest_det_interval = min(detected_intervals, key=lambda x: abs(x - exp_interval))
-                if abs(closest_det_interval - exp_interval) <= grid_tolerance:
-                    matched += 1
-                else:
-                    unmatched += 1
+        matched, unmatched, _ = match_nearest(expected_intervals, detected_intervals, grid_tolerance)
     
     if penalize_missing:
         score = (matched / total_intervals) * 10 if total_intervals > 0 else 10
@@ -142,6 +80,7 @@ def compare_n_fft(filename1, filename2):
     total_time_accuracy = 0
     total_rhythm_accuracy = 0
     num_fft = len(n_fft_values)
+    compute_resolutions([filename1, filename2], n_fft_values, ('onset_peaks',))
 
     for n_fft in n_fft_values:
         times1, freqs1, amps1 = get_peak_frequencies(filename1, n_fft)
@@ -171,8 +110,9 @@ def compare_n_fft(filename1, filename2):
     print(f"Average Rhythm Accuracy: {avg_rhythm_accuracy:.2f}/10")
 
 
-# Example usage
-filename1 = 'Original_32_notes.wav'
-filename2 = '5_notes_off_pitch_5_high_v (2).wav'  # Rep///////.......................................................................lace with the actual second file
+if __name__ == '__main__':
+    # Example usage
+    filename1 = 'Original_32_notes.wav'
+    filename2 = '5_notes_off_pitch_5_high_v (2).wav'  # Rep///////.......................................................................lace with the actual second file
 
-compare_n_fft(filename1, filename2)
+    compare_n_fft(filename1, filename2)
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+def nearest_indices(values, candidates, presorted=False):
+    values = np.asarray(values)
+    candidates = np.asarray(candidates)
+
+    # Sort the candidates once, then binary-search every value at the same time
+    if presorted:
+        order = None
+        sorted_candidates = candidates
+    else:
+        order = np.argsort(candidates, kind='stable')
+        sorted_candidates = candidates[order]
+
+    positions = np.searchsorted(sorted_candidates, values)
+    left = np.clip(positions - 1, 0, len(sorted_candidates) - 1)
+    right = np.clip(positions, 0, len(sorted_candidates) - 1)
+
+    left_errors = np.abs(sorted_candidates[left] - values)
+    right_errors = np.abs(sorted_candidates[right] - values)
+    closest = np.where(right_errors < left_errors, right, left)
+
+    return closest if order is None else order[closest]
+
+
+def nearest_errors(values, candidates, presorted=False):
+    values = np.asarray(values)
+    candidates = np.asarray(candidates)
+
+    if candidates.size == 0:
+        return np.full(values.shape, np.inf)
+
+    return np.abs(candidates[nearest_indices(values, candidates, presorted)] - values)
+
+
+def match_nearest(values, candidates, tolerance):
+    errors = nearest_errors(values, candidates)
+    matched = int(np.count_nonzero(errors <= tolerance))
+    return matched, errors.size - matched, errors
+
+
+def hz_to_midi(frequencies):
+    # Same arithmetic as librosa.hz_to_midi on each frame value on its own: log2 at the
+    # input precision, then the offset in float64. Keeps tight MIDI tolerances bit-identical.
+    frequencies = np.asarray(frequencies)
+    return 12 * (np.log2(frequencies).astype(np.float64) - np.log2(440.0)) + 69
+
+
+def midi_index(pitches):
+    return np.sort(hz_to_midi(pitches))
+
+
+def within_tolerance(values, index, tolerance):
+    return nearest_errors(values, index, presorted=True) <= tolerance
@@ -0,0 +1,97 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+# Per-request breakdown; only collected while a request has opted in
+_breakdown = contextvars.ContextVar("breakdown", default=None)
+
+# Cleared for work that is not serving traffic (warm-up), so it does not skew the histograms
+_recording = contextvars.ContextVar("recording", default=True)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+
+def observe(stage, seconds):
+    if not _recording.get():
+        return
+
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown[stage] = breakdown.get(stage, 0.0) + seconds
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def collect_breakdown():
+    breakdown = {}
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+@contextmanager
+def unrecorded():
+    token = _recording.set(False)
+    try:
+        yield
+    finally:
+        _recording.reset(token)
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        lines.append("# TYPE pymusic_stage_seconds histogram")
+        for stage, histogram in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.buckets):
+                cumulative += count
+                lines.append(f'pymusic_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'pymusic_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+            lines.append(f'pymusic_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines.append("# TYPE pymusic_events_total counter")
+        for name, value in sorted(_counters.items()):
+            lines.append(f'pymusic_events_total{{event="{name}"}} {value}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,78 @@
+import argparse
+import json
+
+import numpy as np
+import librosa
+
+from duration_accuracy import calculate_duration_accuracy
+from features import extract_features
+from matching import hz_to_midi, match_nearest
+from xmlnotes import score_reference
+
+PITCH_TOLERANCE = 0.5  # semitones between a note's median take pitch and the written pitch
+TIMING_TOLERANCE = 0.19  # fraction of the mean written inter-onset interval
+
+
+def align_to_take(reference, user):
+    # The score starts at zero while a recording usually starts after some silence
+    if len(reference["onset_times"]) == 0 or len(user["onset_times"]) == 0:
+        return reference["onset_times"]
+    return reference["onset_times"] + (user["onset_times"][0] - reference["onset_times"][0])
+
+
+def calculate_pitch_accuracy(reference, user_file, tolerance=PITCH_TOLERANCE):
+    user = extract_features(user_file, ('onset_times', 'pitch_track', 'pitch_frames'))
+    if len(reference["midi"]) == 0 or len(user["pitch_track"]) == 0:
+        return {"pitch_accuracy": 0.0}
+
+    note_starts = align_to_take(reference, user)
+    note_ends = note_starts + reference["durations"]
+    frame_times = librosa.frames_to_time(user["pitch_frames"], sr=user["sr"], hop_length=user["hop_length"])
+    user_midi = hz_to_midi(user["pitch_track"])
+
+    # Voiced frames are in time order, so each note's frames are one contiguous slice
+    starts = np.searchsorted(frame_times, note_starts)
+    ends = np.searchsorted(frame_times, note_ends)
+
+    correct_notes = 0
+    for expected, start, end in zip(reference["midi"], starts, ends):
+        if end > start and abs(np.median(user_midi[start:end]) - expected) <= tolerance:
+            correct_notes += 1
+
+    return {"pitch_accuracy": round(correct_notes / len(reference["midi"]) * 10, 2)}
+
+
+def calculate_timing_accuracy(reference, user_file, tolerance=TIMING_TOLERANCE):
+    user = extract_features(user_file, ('onset_times',))
+    if len(reference["onset_times"]) == 0 or len(user["onset_times"]) == 0:
+        return {"timing_accuracy": 0.0}
+
+    intervals = reference["inter_onset_intervals"]
+    threshold = (np.mean(intervals) if len(intervals) > 0 else 1) * tolerance
+    matched, _, _ = match_nearest(align_to_take(reference, user), user["onset_times"], threshold)
+
+    return {"timing_accuracy": min(round(matched / len(reference["onset_times"]) * 10, 1), 10.0)}
+
+
+def score_against_musicxml(xml_file, user_file, bpm=None):
+    # No reference audio at all: the expected notes come straight from the score
+    reference = score_reference(xml_file, bpm)
+    user = extract_features(user_file, ('onset_times', 'pitch_track', 'pitch_frames'))
+
+    return {
+        "pitch_accuracy": calculate_pitch_accuracy(reference, user)["pitch_accuracy"],
+        "timing_accuracy": calculate_timing_accuracy(reference, user)["timing_accuracy"],
+        "duration_accuracy": float(calculate_duration_accuracy(reference, user)["duration_accuracy"]),
+        "tempo": reference["tempo"],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score takes against a MusicXML reference.")
+    parser.add_argument("score", help="MusicXML file with the expected notes")
+    parser.add_argument("takes", nargs="+")
+    parser.add_argument("--bpm", type=float, help="tempo to realise the score at (default: the score's marking)")
+    args = parser.parse_args()
+
+    for take in args.takes:
+        print(json.dumps(dict(file=take, **score_against_musicxml(args.score, take, args.bpm))))
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from audio_cache import DEFAULT_SR, file_hash, load_audio
+from features import FEATURES, compute_features
+from matching import hz_to_midi
+
+# Bump whenever the stored fields or the way they are computed change
+TEMPLATE_VERSION = 5
+
+TEMPLATE_DIR = os.environ.get("REFERENCE_TEMPLATE_DIR", "reference_templates")
+
+DEFAULT_PARAMS = {"sr": DEFAULT_SR, "n_fft": 2048, "hop_length": 512}
+
+# Templates kept in memory, least recently used dropped first
+MAX_CACHED_TEMPLATES = int(os.environ.get("REFERENCE_TEMPLATE_CACHE", 32))
+
+_lock = threading.Lock()
+_templates = OrderedDict()
+
+
+def _lookup(template_id):
+    with _lock:
+        template = _templates.get(template_id)
+        if template is not None:
+            _templates.move_to_end(template_id)
+        return template
+
+
+def _remember(template_id, template):
+    with _lock:
+        _templates[template_id] = template
+        _templates.move_to_end(template_id)
+        while len(_templates) > MAX_CACHED_TEMPLATES:
+            _templates.popitem(last=False)
+
+
+def params_key(params):
+    encoded = json.dumps(dict(params, version=TEMPLATE_VERSION), sort_keys=True)
+    return hashlib.sha1(encoded.encode()).hexdigest()[:12]
+
+
+def template_id(audio_file, params=None):
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    return f"{file_hash(audio_file)}_{params_key(params)}"
+
+
+def template_path(template_id):
+    return os.path.join(TEMPLATE_DIR, f"{template_id}.npz")
+
+
+def analyze_reference(audio_file, params):
+    y, sr = load_audio(audio_file, sr=params["sr"])
+    bundle = compute_features(y, sr, FEATURES, n_fft=params["n_fft"], hop_length=params["hop_length"])
+
+    return {
+        "version": TEMPLATE_VERSION,
+        "params": json.dumps(params, sort_keys=True),
+        "sr": sr,
+        "onset_frames": bundle["onset_frames"],
+        "onset_times": bundle["onset_times"],
+        "inter_onset_intervals": np.diff(bundle["onset_times"]),
+        "note_pitches": bundle["note_pitches"],
+        "note_midi": hz_to_midi(bundle["note_pitches"]),
+        "pitch_track": bundle["pitch_track"],
+        "midi_track": hz_to_midi(bundle["pitch_track"]),
+        "peak_amplitudes": bundle["peak_amplitudes"],
+        "voiced_pitches": bundle["voiced_pitches"],
+        "rms": bundle["rms"],
+        "tempo": bundle["tempo"],
+        "tempo_curve": bundle["tempo_curve"],
+    }
+
+
+def save_template(template, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **template)
+    os.replace(tmp_path, path)
+
+
+def read_template(path):
+    with np.load(path) as data:
+        template = {name: data[name] for name in data.files}
+
+    if int(template.get("version", -1)) != TEMPLATE_VERSION:
+        return None
+
+    for name in ("version", "sr"):
+        template[name] = int(template[name])
+    template["tempo"] = float(template["tempo"])
+    template["params"] = json.loads(str(template["params"]))
+    return template
+
+
+def compile_reference(audio_file, params=None):
+    # Registers a reference: the template is written to TEMPLATE_DIR and can be used by id from then on
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    path = template_path(template_id(audio_file, params))
+    template = analyze_reference(audio_file, params)
+    save_template(template, path)
+    template["params"] = params
+    return path, template
+
+
+def load_template(template_id):
+    if not re.fullmatch(r"[0-9a-f]{40}_[0-9a-f]{12}", template_id):
+        raise KeyError(f"Invalid reference template id {template_id!r}")
+
+    template = _lookup(template_id)
+    if template is not None:
+        return template
+
+    path = template_path(template_id)
+    if not os.path.exists(path):
+        raise KeyError(f"No compiled reference template {template_id}")
+    template = read_template(path)
+    if template is None:
+        raise KeyError(f"Reference template {template_id} was built by an older version")
+
+    _remember(template_id, template)
+    return template
+
+
+def load_reference(reference, params=None):
+    # Accepts a compiled template path or a reference recording. Recordings without a registered template
+    # are analyzed in memory only, so one-off uploads never accumulate in TEMPLATE_DIR.
+    if isinstance(reference, dict):
+        return reference
+    if isinstance(reference, str) and reference.endswith('.npz'):
+        template = read_template(reference)
+        if template is None:
+            raise ValueError(f"{reference} was built by an older template version")
+        return template
+
+    key = template_id(reference, params)
+    try:
+        return load_template(key)
+    except KeyError:
+        pass
+
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    template = analyze_reference(reference, params)
+    template["params"] = params
+    _remember(key, template)
+    return template
+
+
+if __name__ == '__main__':
+    for reference_file in sys.argv[1:]:
+        path, _ = compile_reference(reference_file)
+        print(f"{reference_file} -> {path}")
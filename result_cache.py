@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import increment
+
+MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 4096))
+
+# Results older than this are recomputed even if still cached
+TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL", 7 * 24 * 3600))
+
+# Optional SQLite file that keeps results across restarts and shares them between workers
+DB_PATH = os.environ.get("RESULT_CACHE_DB")
+
+# Seconds to wait for another worker's write lock on the SQLite file before giving up
+DB_TIMEOUT = float(os.environ.get("RESULT_CACHE_DB_TIMEOUT", 5.0))
+
+
+def result_key(reference_key, take_key, version, tolerances):
+    payload = json.dumps([reference_key, take_key, version, tolerances], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _report_error(operation, error):
+    increment("result_cache_error")
+    print(f"Result cache {operation} failed: {type(error).__name__}: {error}", file=sys.stderr)
+
+
+class ResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, db_path=DB_PATH, db_timeout=DB_TIMEOUT):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=db_timeout, check_same_thread=False, isolation_level=None)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires)")
+
+    def _remember(self, key, value, expires):
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+            try:
+                row = self._db.execute("SELECT value, expires FROM results WHERE key = ? AND expires > ?",
+                                       (key, now)).fetchone()
+            except sqlite3.Error as e:
+                _report_error("read", e)
+                return None
+            if row is None:
+                return None
+            self._remember(key, row[0], row[1])
+            return json.loads(row[0])
+
+    def set(self, key, result):
+        # Best effort: a result that cannot be cached is still a result, so failures are only reported
+        try:
+            # Stored as JSON so every hit hands out a fresh copy
+            value = json.dumps(result)
+        except (TypeError, ValueError) as e:
+            _report_error("write", e)
+            return
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)",
+                                     (key, value, expires))
+                    self._db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+                except sqlite3.Error as e:
+                    _report_error("write", e)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
@@ -0,0 +1,179 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import librosa
+
+from audio_cache import DEFAULT_SR, file_hash, load_audio
+
+FEATURES = ('frame_peaks', 'onset_envelope', 'onset_peaks')
+
+# Number of processes used to fan a sweep out; 1 keeps everything in-process
+WORKERS = int(os.environ.get("SPECTROGRAM_WORKERS", os.cpu_count() or 1))
+
+MAX_CACHED_ENTRIES = 1024
+
+_lock = threading.Lock()
+_results = OrderedDict()
+
+# One pool reused by every sweep instead of a new one per call
+_pool_lock = threading.Lock()
+_pool = None
+_pool_workers = 0
+
+
+def extract_frame_peaks(pitches, magnitudes, return_frames=False):
+    # Strongest bin of every frame at once; unvoiced frames (pitch 0) are dropped
+    frames = np.arange(pitches.shape[1])
+    peak_bins = magnitudes.argmax(axis=0)
+    pitch_values = pitches[peak_bins, frames].astype(np.float32, copy=False)
+    dynamics_values = magnitudes[peak_bins, frames].astype(np.float32, copy=False)
+
+    voiced = pitch_values > 0
+    if return_frames:
+        return pitch_values[voiced], dynamics_values[voiced], frames[voiced]
+    return pitch_values[voiced], dynamics_values[voiced]
+
+
+def detect_onset_frames(y, sr):
+    return librosa.onset.onset_detect(y=y, sr=sr, backtrack=True, units='frames', delta=0.01)
+
+
+def extract_onset_peaks(S, sr, onset_frames):
+    frequencies = librosa.fft_frequencies(sr=sr)
+    onset_frames = onset_frames[onset_frames < S.shape[1]]
+
+    spectra = S[:, onset_frames]
+    peaks = np.argmax(spectra, axis=0)
+    peak_freqs = frequencies[peaks]
+    peak_amps = np.max(spectra, axis=0)
+
+    in_range = (peak_freqs >= 50) & (peak_freqs <= 1000)
+    peak_times = librosa.frames_to_time(onset_frames[in_range], sr=sr)
+
+    return peak_times, peak_freqs[in_range], peak_amps[in_range]
+
+
+def analyze_resolution(y, sr, n_fft, features, onset_frames=None):
+    result = {}
+
+    # One magnitude STFT per resolution feeds both piptrack and the onset peak picker
+    if 'frame_peaks' in features or 'onset_peaks' in features:
+        S = np.abs(librosa.stft(y, n_fft=n_fft))
+
+        if 'frame_peaks' in features:
+            pitches, magnitudes = librosa.core.piptrack(S=S, sr=sr, n_fft=n_fft)
+            result['frame_peaks'] = extract_frame_peaks(pitches, magnitudes)
+
+        if 'onset_peaks' in features:
+            if onset_frames is None:
+                onset_frames = detect_onset_frames(y, sr)
+            result['onset_peaks'] = extract_onset_peaks(S, sr, onset_frames)
+
+    if 'onset_envelope' in features:
+        result['onset_envelope'] = librosa.onset.onset_strength(y=y, sr=sr, n_fft=n_fft)
+
+    return result
+
+
+def _analyze_task(args):
+    source, sr, n_fft, features, onset_frames = args
+    # Files on disk are decoded where the task runs, so the samples never cross the process boundary;
+    # each worker's audio cache then decodes a file once however many resolutions it is given
+    y, rate = load_audio(source, sr=sr) if isinstance(source, str) else source
+    return analyze_resolution(y, rate, n_fft, features, onset_frames)
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _lookup(key):
+    with _lock:
+        value = _results.get(key)
+        if value is not None:
+            _results.move_to_end(key)
+        return value
+
+
+def _remember(key, value):
+    with _lock:
+        _results[key] = value
+        _results.move_to_end(key)
+        while len(_results) > MAX_CACHED_ENTRIES:
+            _results.popitem(last=False)
+
+
+def _missing_features(digest, sr, n_fft, features):
+    return tuple(feature for feature in features if _lookup((digest, sr, n_fft, feature)) is None)
+
+
+def _onset_frames(digest, y, sr):
+    key = (digest, sr, None, 'onset_frames')
+    onset_frames = _lookup(key)
+    if onset_frames is None:
+        onset_frames = detect_onset_frames(y, sr)
+        _remember(key, onset_frames)
+    return onset_frames
+
+
+def compute_resolutions(audio_files, n_fft_values, features=FEATURES, sr=DEFAULT_SR, workers=None):
+    workers = WORKERS if workers is None else workers
+
+    tasks = []
+    task_keys = []
+    for audio_file in audio_files:
+        digest = file_hash(audio_file)
+        for n_fft in n_fft_values:
+            missing = _missing_features(digest, sr, n_fft, features)
+            if not missing:
+                continue
+            onset_frames = None
+            if 'onset_peaks' in missing:
+                # Shared by every resolution of the file, so detected once here rather than per task
+                onset_frames = _onset_frames(digest, *load_audio(audio_file, sr=sr))
+            # Streams cannot be reopened in a worker, so their samples go with the task
+            source = audio_file if isinstance(audio_file, str) else load_audio(audio_file, sr=sr)
+            tasks.append((source, sr, n_fft, missing, onset_frames))
+            task_keys.append((digest, n_fft))
+
+    if workers > 1 and len(tasks) > 1:
+        pool = _get_pool(workers)
+        try:
+            results = list(pool.map(_analyze_task, tasks))
+        except BrokenProcessPool:
+            # A worker died; the next sweep starts a fresh pool
+            _discard_pool(pool)
+            raise
+    else:
+        results = [_analyze_task(task) for task in tasks]
+
+    for (digest, n_fft), result in zip(task_keys, results):
+        for feature, value in result.items():
+            _remember((digest, sr, n_fft, feature), value)
+
+
+def get_resolution(audio_file, n_fft, features=FEATURES, sr=DEFAULT_SR):
+    digest = file_hash(audio_file)
+    if _missing_features(digest, sr, n_fft, features):
+        compute_resolutions([audio_file], [n_fft], features, sr=sr, workers=1)
+    return {feature: _lookup((digest, sr, n_fft, feature)) for feature in features}
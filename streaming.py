@@ -0,0 +1,153 @@
+import numpy as np
+import librosa
+
+from audio_cache import DEFAULT_SR
+from spectrogram import extract_frame_peaks
+
+# Samples read from disk per step; peak memory scales with this, not with the recording
+BLOCK_SAMPLES = 1 << 18
+
+
+def scaled_frame_params(sr, n_fft=2048, hop_length=512):
+    # Streams run at the file's native rate; scale the window so frames span the same time as at 22050 Hz
+    scale = sr / DEFAULT_SR
+    return int(round(n_fft * scale)), int(round(hop_length * scale))
+
+
+class OnsetPeakPicker:
+    # Incremental version of librosa.onset.onset_detect's peak picking with its default
+    # windows. The envelope is normalised by its running maximum instead of the global one.
+    def __init__(self, sr, hop_length, delta=0.07):
+        self.pre_max = int(0.03 * sr // hop_length)
+        self.post_max = int(0.00 * sr // hop_length) + 1
+        self.pre_avg = int(0.10 * sr // hop_length)
+        self.post_avg = int(0.10 * sr // hop_length) + 1
+        self.wait = int(0.03 * sr // hop_length)
+        self.delta = delta
+
+        self.lookahead = max(self.post_max, self.post_avg)
+        self.context = max(self.pre_max, self.pre_avg)
+
+        self.history = np.zeros(0, dtype=np.float32)
+        self.history_start = 0
+        self.next_frame = 0
+        self.last_onset = -np.inf
+        self.peak_value = 0.0
+
+    def push(self, onset_env, final=False):
+        self.history = np.concatenate([self.history, onset_env.astype(np.float32)])
+        if onset_env.size:
+            self.peak_value = max(self.peak_value, float(onset_env.max()))
+
+        total = self.history_start + len(self.history)
+        ready_until = total if final else total - self.lookahead + 1
+        onsets = []
+
+        if ready_until > self.next_frame and self.peak_value > 0:
+            env = self.history / self.peak_value
+            for frame in range(self.next_frame, ready_until):
+                i = frame - self.history_start
+                local = env[max(0, i - self.pre_max):i + self.post_max]
+                average = env[max(0, i - self.pre_avg):i + self.post_avg].mean()
+                if env[i] == local.max() and env[i] >= average + self.delta and frame - self.last_onset > self.wait:
+                    onsets.append(frame)
+                    self.last_onset = frame
+
+        self.next_frame = max(self.next_frame, ready_until)
+
+        # Only the look-back context of undecided frames needs to stay around
+        keep_from = max(self.history_start, self.next_frame - self.context)
+        self.history = self.history[keep_from - self.history_start:]
+        self.history_start = keep_from
+
+        return np.array(onsets, dtype=int)
+
+
+class StreamingAnalyzer:
+    def __init__(self, sr, n_fft=None, hop_length=None):
+        default_n_fft, default_hop = scaled_frame_params(sr)
+        self.sr = sr
+        self.n_fft = n_fft or default_n_fft
+        self.hop_length = hop_length or default_hop
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=self.n_fft)
+        self.picker = OnsetPeakPicker(sr, self.hop_length)
+
+        self.tail = np.zeros(0, dtype=np.float32)
+        self.frame_offset = 0
+        self.previous_mel = None
+
+    def frames_to_time(self, frames):
+        # Frames are not centred, so report the time of each window's midpoint
+        return (np.asarray(frames) * self.hop_length + self.n_fft // 2) / self.sr
+
+    def _analyze(self, samples, final=False):
+        n_frames = 1 + (len(samples) - self.n_fft) // self.hop_length if len(samples) >= self.n_fft else 0
+        if n_frames == 0:
+            self.tail = samples
+            return self._result(np.zeros(0), np.zeros(0, dtype=int), self.picker.push(np.zeros(0), final))
+
+        used = (n_frames - 1) * self.hop_length + self.n_fft
+        S = np.abs(librosa.stft(samples[:used], n_fft=self.n_fft, hop_length=self.hop_length, center=False))
+        frames = self.frame_offset + np.arange(n_frames)
+
+        # Onset strength: mean positive log-mel flux, carried across chunk boundaries
+        mel_db = librosa.power_to_db(self.mel_basis @ S**2, top_db=None)
+        previous = mel_db[:, :1] if self.previous_mel is None else self.previous_mel
+        flux = np.diff(np.concatenate([previous, mel_db], axis=1), axis=1)
+        onset_env = np.maximum(0.0, flux).mean(axis=0)
+        self.previous_mel = mel_db[:, -1:]
+
+        pitches, magnitudes = librosa.core.piptrack(S=S, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length)
+        pitch_track, amplitudes, voiced_frames = extract_frame_peaks(pitches, magnitudes, return_frames=True)
+
+        self.frame_offset += n_frames
+        self.tail = samples[n_frames * self.hop_length:]
+
+        onsets = self.picker.push(onset_env, final)
+        return self._result(frames[voiced_frames], pitch_track, onsets, amplitudes)
+
+    def _result(self, pitch_frames, pitch_track, onset_frames, amplitudes=None):
+        return {
+            "onset_times": self.frames_to_time(onset_frames),
+            "pitch_times": self.frames_to_time(pitch_frames),
+            "pitch_track": pitch_track,
+            "peak_amplitudes": np.zeros(0) if amplitudes is None else amplitudes,
+        }
+
+    def push(self, samples):
+        samples = np.concatenate([self.tail, np.asarray(samples, dtype=np.float32)])
+        return self._analyze(samples)
+
+    def finish(self):
+        # Pad the remainder so the last partial window is still analysed
+        samples = self.tail
+        if len(samples) > 0:
+            samples = np.concatenate([samples, np.zeros(self.n_fft, dtype=np.float32)])
+        return self._analyze(samples, final=True)
+
+
+def stream_analysis(audio_file, block_samples=BLOCK_SAMPLES, n_fft=None, hop_length=None):
+    sr = librosa.get_samplerate(audio_file)
+    analyzer = StreamingAnalyzer(sr, n_fft, hop_length)
+
+    blocks = librosa.stream(audio_file, block_length=1, frame_length=block_samples,
+                            hop_length=block_samples, mono=True)
+    for block in blocks:
+        yield analyzer.push(block)
+    yield analyzer.finish()
+
+
+def analyze_long_recording(audio_file, block_samples=BLOCK_SAMPLES, n_fft=None, hop_length=None):
+    parts = {"onset_times": [], "pitch_times": [], "pitch_track": [], "peak_amplitudes": []}
+    for result in stream_analysis(audio_file, block_samples, n_fft, hop_length):
+        for name, values in result.items():
+            parts[name].append(values)
+    return {name: np.concatenate(values) for name, values in parts.items()}
+
+
+if __name__ == '__main__':
+    import sys
+
+    for audio_file in sys.argv[1:]:
+        result = analyze_long_recording(audio_file)
+        print(f"{audio_file}: {len(result['onset_times'])} onsets, {len(result['pitch_track'])} voiced frames")
@@ -1,14 +1,15 @@
-import librosa
 import numpy as np
+import librosa
+from features import extract_features
+from reference import load_reference
+
+# Local tempo is summarised over windows of this many seconds of the take
+SEGMENT_SECONDS = 2.0
 
 # Function to estimate tempo with enhanced onset detection
 def estimate_tempo(file_path, ref_tempo=None):
-    y, sr = librosa.load(file_path)
-    
-    # Enhanced onset detection with tuned parameters
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, aggregate=np.median)
-    onset_env = np.convolve(onset_env, np.ones(10)/10, mode='same')  # Smoothing
-    tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
+    # Median-aggregated onset envelope, smoothed, then beat tracked (see features.estimate_global_tempo)
+    tempo = extract_features(file_path, ('tempo',))['tempo']
     
     # Dynamic tempo adjustment
     if ref_tempo is not None:
@@ -19,58 +20,105 @@ def estimate_tempo(file_path, ref_tempo=None):
     
     return float(tempo)
 
-# List of files to compare
-files_to_compare = [
-    'Original_32_notes.wav',
-    '3_extra_notes_2_off_pitch_1_off_timing (2).wav',
-    '5_notes_high_volume.wav',
-    '5_notes_missing (1).wav',
-    '5_notes_off_pitch (3).wav',
-    '5_notes_off_pitch_5_high_v (2).wav',
-    '5_notes_off_time.wav',
-    '7.wav',
-    '8_notes_longer_hold (1).wav',
-    '8.5.wav',
-    '9.5.wav',
-    '10_notes_high_tempo.wav',
-    '10_notes_high_tempo0_notes_low_tempo.wav',
-    '10_notes_low_volume.wav',
-    '10_notes_mixed_volume.wav',
-    '10_notes_off_time.wav',
-    '10_notes_staccato (2).wav'
-]
-
-# Estimate the reference tempo from the original file
-reference_file = files_to_compare[0]
-ref_tempo = estimate_tempo(reference_file)
-
-# Store results
-results = []
-
-# Compare each file with the reference tempo
-for file in files_to_compare[1:]:  # Skip the reference file
-    test_tempo = estimate_tempo(file, ref_tempo)
-    
-    # Calculate tempo accuracy as a percentage of deviation
-    tempo_accuracy = 100 - abs((test_tempo - ref_tempo) / ref_tempo * 100)
-    
-    # Apply a threshold for significant differences
-    significant_difference = abs(test_tempo - ref_tempo) > 5  # Example threshold of 5 BPM
-    
-    results.append({
-        'file': file,
-        'ref_tempo': ref_tempo,
-        'test_tempo': test_tempo,
-        'tempo_accuracy': tempo_accuracy,
-        'significant_difference': significant_difference
-    })
-
-# Display results
-for result in results:
-    print(f"File: {result['file']}")
-    print(f"Reference Tempo: {result['ref_tempo']} BPM")
-    print(f"Test Tempo: {result['test_tempo']} BPM")
-    print(f"Tempo Accuracy: {result['tempo_accuracy']:.2f}%")
-    if result['significant_difference']:
-        print("Significant tempo difference detected!")
-    print("-" * 50)
+def fold_octaves(curve, ref_curve):
+    # Same halving/doubling rule as estimate_tempo, applied frame by frame
+    curve = np.where(curve > ref_curve * 1.3, curve / 2, curve)
+    return np.where(curve < ref_curve / 1.3, curve * 2, curve)
+
+def segment_tempo_deviation(reference, file_path, segment_seconds=SEGMENT_SECONDS):
+    # Both curves come from onset envelopes already computed for scoring; the reference one lives in its template
+    reference = load_reference(reference)
+    take = extract_features(file_path, ('tempo_curve',))
+    ref_curve = reference["tempo_curve"]
+    curve = take["tempo_curve"]
+    if len(curve) == 0 or len(ref_curve) == 0:
+        return {"segment_starts": np.zeros(0), "test_tempo": np.zeros(0), "ref_tempo": np.zeros(0),
+                "deviation_percent": np.zeros(0)}
+
+    # Compare each take frame with the reference at the same relative position in the piece
+    positions = np.arange(len(curve)) / len(curve)
+    ref_at_take = ref_curve[np.minimum((positions * len(ref_curve)).astype(int), len(ref_curve) - 1)]
+    curve = fold_octaves(curve, ref_at_take)
+
+    times = librosa.frames_to_time(np.arange(len(curve)), sr=take["sr"], hop_length=take["hop_length"])
+    segments = (times // segment_seconds).astype(int)
+    starts = np.unique(segments)
+    test_tempo = np.array([np.median(curve[segments == segment]) for segment in starts])
+    ref_tempo = np.array([np.median(ref_at_take[segments == segment]) for segment in starts])
+
+    return {
+        "segment_starts": starts * segment_seconds,
+        "test_tempo": test_tempo,
+        "ref_tempo": ref_tempo,
+        "deviation_percent": (test_tempo - ref_tempo) / ref_tempo * 100,
+    }
+
+def compare_tempo_curves(reference, file_paths, segment_seconds=SEGMENT_SECONDS):
+    # The reference template (and its curve) is loaded once for the whole batch
+    reference = load_reference(reference)
+    return [dict(file=file_path, **segment_tempo_deviation(reference, file_path, segment_seconds))
+            for file_path in file_paths]
+
+if __name__ == '__main__':
+    # List of files to compare
+    files_to_compare = [
+        'Original_32_notes.wav',
+        '3_extra_notes_2_off_pitch_1_off_timing (2).wav',
+        '5_notes_high_volume.wav',
+        '5_notes_missing (1).wav',
+        '5_notes_off_pitch (3).wav',
+        '5_notes_off_pitch_5_high_v (2).wav',
+        '5_notes_off_time.wav',
+        '7.wav',
+        '8_notes_longer_hold (1).wav',
+        '8.5.wav',
+        '9.5.wav',
+        '10_notes_high_tempo.wav',
+        '10_notes_high_tempo0_notes_low_tempo.wav',
+        '10_notes_low_volume.wav',
+        '10_notes_mixed_volume.wav',
+        '10_notes_off_time.wav',
+        '10_notes_staccato (2).wav'
+    ]
+
+    # Estimate the reference tempo from the original file
+    reference_file = files_to_compare[0]
+    ref_tempo = load_reference(reference_file)["tempo"]
+
+    # Store results
+    results = []
+
+    # Compare each file with the reference tempo
+    for file in files_to_compare[1:]:  # Skip the reference file
+        test_tempo = estimate_tempo(file, ref_tempo)
+
+        # Calculate tempo accuracy as a percentage of deviation
+        tempo_accuracy = 100 - abs((test_tempo - ref_tempo) / ref_tempo * 100)
+
+        # Apply a threshold for significant differences
+        significant_difference = abs(test_tempo - ref_tempo) > 5  # Example threshold of 5 BPM
+
+        results.append({
+            'file': file,
+            'ref_tempo': ref_tempo,
+            'test_tempo': test_tempo,
+            'tempo_accuracy': tempo_accuracy,
+            'significant_difference': significant_difference
+        })
+
+    # Where each take sped up or slowed down
+    curves = {result['file']: result for result in compare_tempo_curves(reference_file, files_to_compare[1:])}
+
+    # Display results
+    for result in results:
+        print(f"File: {result['file']}")
+        print(f"Reference Tempo: {result['ref_tempo']} BPM")
+        print(f"Test Tempo: {result['test_tempo']} BPM")
+        print(f"Tempo Accuracy: {result['tempo_accuracy']:.2f}%")
+        if result['significant_difference']:
+            print("Significant tempo difference detected!")
+        curve = curves[result['file']]
+        for start, deviation in zip(curve['segment_starts'], curve['deviation_percent']):
+            if abs(deviation) > 5:
+                print(f"  {start:.0f}s: {deviation:+.1f}% against the reference")
+        print("-" * 50)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from alignment import align_notes, banded_dtw
+
+
+def full_dtw_cost(cost):
+    n, m = cost.shape
+    accumulated = np.full((n + 1, m + 1), np.inf)
+    accumulated[0, 0] = 0.0
+    for i in range(n):
+        for j in range(m):
+            accumulated[i + 1, j + 1] = cost[i, j] + min(accumulated[i, j], accumulated[i, j + 1], accumulated[i + 1, j])
+    return accumulated[n, m]
+
+
+def melody(n=32, seed=0):
+    rng = np.random.default_rng(seed)
+    onsets = 1.0 + np.concatenate([[0.0], np.cumsum(rng.choice([0.25, 0.5, 1.0], n - 1))])
+    return onsets, rng.integers(55, 75, n).astype(float)
+
+
+@pytest.mark.parametrize("n_reference, n_take", [(4, 9), (9, 4), (32, 44), (44, 32), (1, 5), (5, 1)])
+def test_banded_dtw_handles_unequal_lengths(n_reference, n_take):
+    cost = np.random.default_rng(n_reference * 100 + n_take).random((n_reference, n_take))
+    path, total = banded_dtw(lambda i, c: cost[i, c], n_reference, n_take, band=1)
+
+    assert tuple(path[0]) == (0, 0) and tuple(path[-1]) == (n_reference - 1, n_take - 1)
+    assert np.all(np.diff(path, axis=0) >= 0) and np.all(np.diff(path, axis=0).sum(axis=1) >= 1)
+    assert total == pytest.approx(cost[path[:, 0], path[:, 1]].sum())
+    assert total >= full_dtw_cost(cost) - 1e-9
+
+
+def test_banded_dtw_matches_full_dtw_with_a_wide_band():
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        n_reference, n_take = rng.integers(1, 20, 2)
+        cost = rng.random((n_reference, n_take))
+        _, total = banded_dtw(lambda i, c: cost[i, c], n_reference, n_take, band=20)
+        assert total == pytest.approx(full_dtw_cost(cost))
+
+
+def test_take_with_extra_notes_at_the_start():
+    onsets, pitches = melody()
+    false_start = np.linspace(0.0, 0.8, 12)
+    alignment = align_notes(onsets, pitches, np.concatenate([false_start, onsets + 0.5]),
+                            np.concatenate([np.full(12, 50.0), pitches]))
+
+    np.testing.assert_array_equal(alignment["reference_notes"], np.arange(32))
+    np.testing.assert_array_equal(alignment["take_notes"], np.arange(32) + 12)
+    np.testing.assert_array_equal(alignment["extra"], np.arange(12))
+
+
+def test_take_with_missing_notes():
+    onsets, pitches = melody()
+    kept = np.setdiff1d(np.arange(32), [4, 10, 17, 22, 29])
+    alignment = align_notes(onsets, pitches, onsets[kept], pitches[kept])
+
+    np.testing.assert_array_equal(alignment["reference_notes"], kept)
+    np.testing.assert_array_equal(alignment["take_notes"], np.arange(len(kept)))
+    np.testing.assert_array_equal(alignment["missing"], [4, 10, 17, 22, 29])
+
+
+def test_take_that_slows_down():
+    onsets, pitches = melody()
+    stretch = np.linspace(1.0, 1.6, len(onsets))
+    alignment = align_notes(onsets, pitches, 1.0 + np.cumsum(np.diff(onsets, prepend=1.0) * stretch), pitches)
+
+    np.testing.assert_array_equal(alignment["take_notes"], np.arange(32))
@@ -0,0 +1,27 @@
+import os
+import time
+
+import app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read(name):
+    with open(os.path.join(ROOT, name), 'rb') as f:
+        return f.read()
+
+
+def test_scoring_job_completes_on_the_first_pool():
+    executor = app.job_pool._executor
+    assert executor is not None
+
+    job_id = app.job_pool.submit(app.run_scoring_job, read('Original_32_notes.wav'), read('7.wav'))
+    deadline = time.time() + 300
+    while app.job_pool.status(job_id)["status"] not in ("done", "failed") and time.time() < deadline:
+        time.sleep(0.1)
+
+    status = app.job_pool.status(job_id)
+    assert status["status"] == "done", status
+    assert set(app.job_pool.result(job_id)) == {"pitch_accuracy", "timing_accuracy"}
+    # No worker died, so the pool the app started with is still the one in use
+    assert app.job_pool._executor is executor
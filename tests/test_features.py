@@ -0,0 +1,13 @@
+import numpy as np
+import librosa
+import pytest
+
+from features import compute_features
+from warmup import synthetic_take
+
+
+def test_rms_matches_time_domain_rms():
+    y = synthetic_take()
+    rms = compute_features(y, 22050, ('rms',))['rms']
+    np.testing.assert_allclose(rms, librosa.feature.rms(y=y)[0], rtol=1e-5)
+    assert np.mean(rms) == pytest.approx(np.mean(librosa.feature.rms(y=y)), rel=1e-5)
@@ -0,0 +1,41 @@
+import os
+import time
+
+from jobs import JobPool
+
+
+def square(x):
+    time.sleep(0.2)
+    return x * x
+
+
+def crash():
+    time.sleep(0.1)
+    os._exit(1)
+
+
+def wait_for(pool, job_ids, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        statuses = {job_id: pool.status(job_id)["status"] for job_id in job_ids}
+        if all(status in ("done", "failed") for status in statuses.values()):
+            return statuses
+        time.sleep(0.05)
+    raise AssertionError(f"jobs did not finish: {statuses}")
+
+
+def test_dead_worker_fails_only_its_job():
+    pool = JobPool(workers=2)
+    jobs = [pool.submit(square, i) for i in range(3)]
+    crashed = pool.submit(crash)
+    jobs += [pool.submit(square, i) for i in range(3, 6)]
+
+    statuses = wait_for(pool, jobs + [crashed])
+    assert statuses.pop(crashed) == "failed"
+    assert set(statuses.values()) == {"done"}
+    assert [pool.result(job_id) for job_id in jobs] == [i * i for i in range(6)]
+
+    # The pool keeps serving after the crash
+    job_id = pool.submit(square, 7)
+    assert wait_for(pool, [job_id]) == {job_id: "done"}
+    assert pool.stats()["failed"] == 1
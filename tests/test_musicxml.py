@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+import pytest
+
+from musicxml_scoring import score_against_musicxml
+from xmlnotes import parse_score_notes, score_reference
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCORE = os.path.join(ROOT, 'Original.xml')
+
+
+def test_score_uses_only_the_melody_staff():
+    notes = parse_score_notes(SCORE)
+    # 21 notes in the treble staff; the bass staff's chords are not expected notes
+    assert len(notes["midi"]) == 21
+    assert notes["midi"].min() == 73
+    assert np.all(score_reference(SCORE)["inter_onset_intervals"] > 0)
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_reference_recording_matches_its_own_score():
+    result = score_against_musicxml(SCORE, os.path.join(ROOT, 'Original_32_notes.wav'))
+    assert result["timing_accuracy"] >= 9.5
+    assert result["duration_accuracy"] >= 9.5
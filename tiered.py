@@ -0,0 +1,96 @@
+import argparse
+import json
+
+import numpy as np
+
+import check
+import timing_accuracy
+from features import extract_features
+from spectrogram import get_resolution
+
+# First pass: half the sample rate and one resolution, with the window halved so frames span the same time
+FAST_SR = 11025
+FAST_N_FFT = 1024
+FAST_HOP_LENGTH = 256
+
+# Single resolution the fast pitch/dynamics pass reads instead of the full check.py sweep: n_fft 2048 at the
+# full rate, halved at FAST_SR so each frame spans the same time with the same bin spacing
+FAST_SWEEP_N_FFT = 1024
+FULL_RATE_SWEEP_N_FFT = 2048
+
+# Scores this close to the pass mark are re-scored with the full sweeps
+PASS_MARK = 7.0
+ESCALATION_MARGIN = 1.0
+
+
+def near_boundary(score, pass_mark=PASS_MARK, margin=ESCALATION_MARGIN):
+    return abs(score - pass_mark) < margin
+
+
+def fast_timing_accuracy(original_file, user_file):
+    # Onset-only features at the low rate, scored as a one-resolution timing sweep so the result is on the
+    # same scale (ten-share and rounding rules included) as the accurate score it may escalate to
+    features = ('onset_times', 'rms')
+    original = extract_features(original_file, features, sr=FAST_SR, n_fft=FAST_N_FFT, hop_length=FAST_HOP_LENGTH)
+    user = extract_features(user_file, features, sr=FAST_SR, n_fft=FAST_N_FFT, hop_length=FAST_HOP_LENGTH)
+    score = timing_accuracy.calculate_timing_accuracy_score(
+        original["onset_times"], user["onset_times"], timing_accuracy.threshold,
+        float(np.mean(original["rms"])), float(np.mean(user["rms"])))
+    return timing_accuracy.calculate_final_score([score])
+
+
+def _fast_frame_peaks(audio_file):
+    pitches, dynamics = get_resolution(audio_file, FAST_SWEEP_N_FFT, ('frame_peaks',), sr=FAST_SR)['frame_peaks']
+    # STFT magnitudes grow with the window length; rescale so check.py's absolute dynamics tolerances still apply
+    return pitches, dynamics * (FULL_RATE_SWEEP_N_FFT / FAST_SWEEP_N_FFT)
+
+
+def fast_pitch_and_dynamics_accuracy(original_file, user_file):
+    original_pitches, original_dynamics = _fast_frame_peaks(original_file)
+    user_pitches, user_dynamics = _fast_frame_peaks(user_file)
+    pitch_accuracy = check.calculate_pitch_score(original_pitches, user_pitches, original_dynamics, user_dynamics,
+                                                 check.pitch_tolerance, check.dynamics_tolerance_for_pitch)
+    dynamics_accuracy = check.calculate_dynamics_score(original_dynamics, user_dynamics, original_pitches,
+                                                       user_pitches, check.dynamics_tolerance,
+                                                       check.pitch_tolerance_for_dynamics)
+    return pitch_accuracy, dynamics_accuracy
+
+
+def tiered_scores(original_file, user_file, pass_mark=PASS_MARK, margin=ESCALATION_MARGIN):
+    tiers = {}
+
+    timing = fast_timing_accuracy(original_file, user_file)
+    tiers["timing"] = "fast"
+    if near_boundary(timing, pass_mark, margin):
+        _, timing = timing_accuracy.main(original_file, user_file, timing_accuracy.n_fft_values,
+                                         timing_accuracy.threshold)
+        tiers["timing"] = "accurate"
+
+    pitch, dynamics = fast_pitch_and_dynamics_accuracy(original_file, user_file)
+    tiers["pitch_dynamics"] = "fast"
+    # One sweep yields both scores, so either being borderline escalates the pair
+    if near_boundary(pitch, pass_mark, margin) or near_boundary(dynamics, pass_mark, margin):
+        _, _, pitch, dynamics = check.calculate_pitch_and_dynamics_accuracy(
+            original_file, user_file, check.n_fft_values_pitch, check.n_fft_values_dynamics,
+            check.pitch_tolerance, check.dynamics_tolerance_for_pitch, check.dynamics_tolerance,
+            check.pitch_tolerance_for_dynamics)
+        tiers["pitch_dynamics"] = "accurate"
+
+    return {
+        "timing_accuracy": float(timing),
+        "pitch_accuracy": float(pitch),
+        "dynamics_accuracy": float(dynamics),
+        "tiers": tiers,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score takes cheaply, re-scoring borderline results in full.")
+    parser.add_argument("reference")
+    parser.add_argument("takes", nargs="+")
+    parser.add_argument("--pass-mark", type=float, default=PASS_MARK)
+    parser.add_argument("--margin", type=float, default=ESCALATION_MARGIN)
+    args = parser.parse_args()
+
+    for take in args.takes:
+        print(json.dumps(dict(file=take, **tiered_scores(args.reference, take, args.pass_mark, args.margin))))
@@ -1,23 +1,26 @@
 import numpy as np
 import librosa
 import warnings
+from audio_cache import DEFAULT_SR
+from features import extract_features
+from spectrogram import compute_resolutions, get_resolution
 
 # Suppress specific warnings from librosa
 warnings.filterwarnings("ignore", category=UserWarning, module="librosa")
 
 def detect_onsets_and_tempo(audio_file, n_fft):
-    y, sr = librosa.load(audio_file)
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, n_fft=n_fft)
-    onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-    onsets_times = librosa.frames_to_time(onsets, sr=sr)
-    return onsets_times, y
+    onset_env = get_resolution(audio_file, n_fft, ('onset_envelope',))['onset_envelope']
+    onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=DEFAULT_SR)
+    onsets_times = librosa.frames_to_time(onsets, sr=DEFAULT_SR)
+    return onsets_times
 
-def calculate_timing_accuracy_score(orig_onsets, user_onsets, threshold, orig_y, user_y):
+def mean_rms(audio_file):
+    return float(np.mean(extract_features(audio_file, ('rms',))['rms']))
+
+def calculate_timing_accuracy_score(orig_onsets, user_onsets, threshold, orig_rms, user_rms):
     if len(orig_onsets) == 0 or len(user_onsets) == 0:
         return 5.0
 
-    orig_rms = np.mean(librosa.feature.rms(y=orig_y))
-    user_rms = np.mean(librosa.feature.rms(y=user_y))
     volume_difference = abs(orig_rms - user_rms)
 
     if volume_difference > 0.5:
@@ -51,20 +54,34 @@ def calculate_final_score(timing_accuracies, ten_threshold=0.4, outlier_threshol
 
     return round(final_score) if final_score >= 9.5 else final_score
 
-def main(original_file, user_file, n_fft_values, threshold):
+def analyze_original(original_file, n_fft_values, workers=None):
+    # Onsets per resolution and loudness of the original; reusable for every take compared against it
+    compute_resolutions([original_file], n_fft_values, ('onset_envelope',), workers=workers)
+    onsets = {n_fft: detect_onsets_and_tempo(original_file, n_fft) for n_fft in n_fft_values}
+    return onsets, mean_rms(original_file)
+
+def score_against_original(original, user_file, n_fft_values, threshold, workers=None):
+    orig_onsets, orig_rms = original
     timing_accuracies = []
+    compute_resolutions([user_file], n_fft_values, ('onset_envelope',), workers=workers)
+    user_rms = mean_rms(user_file)
 
     for n_fft in n_fft_values:
-        orig_onsets, orig_y = detect_onsets_and_tempo(original_file, n_fft)
-        user_onsets, user_y = detect_onsets_and_tempo(user_file, n_fft)
-        
-        timing_accuracy_score = calculate_timing_accuracy_score(orig_onsets, user_onsets, threshold, orig_y, user_y)
+        user_onsets = detect_onsets_and_tempo(user_file, n_fft)
+
+        timing_accuracy_score = calculate_timing_accuracy_score(orig_onsets[n_fft], user_onsets, threshold, orig_rms, user_rms)
         timing_accuracies.append(timing_accuracy_score)
 
     final_timing_accuracy = calculate_final_score(timing_accuracies)
     
     return timing_accuracies, final_timing_accuracy
 
+def main(original_file, user_file, n_fft_values, threshold, workers=None):
+    # Both files' resolutions in one pool; the two calls below then read them from the cache
+    compute_resolutions([original_file, user_file], n_fft_values, ('onset_envelope',), workers=workers)
+    original = analyze_original(original_file, n_fft_values, workers)
+    return score_against_original(original, user_file, n_fft_values, threshold, workers)
+
 # Parameters
 n_fft_values = [
     128, 1536, 1920, 
@@ -72,30 +89,31 @@ n_fft_values = [
     26624, 28672, 30720
 ]
 
-original_file = 'Original_32_notes.wav'
-user_files = [
-    '3_extra_notes_2_off_pitch_1_off_timing (2).wav',
-    '5_notes_high_volume.wav',
-    '5_notes_missing (1).wav',
-    '5_notes_off_pitch (3).wav',
-    '5_notes_off_pitch_5_high_v (2).wav',
-    '5_notes_off_time.wav',
-    '7.wav',
-    '8_notes_longer_hold (1).wav',
-    '8.5.wav',
-    '9.5.wav',
-    '10_notes_high_tempo.wav',
-    '10_notes_high_tempo0_notes_low_tempo.wav',
-    '10_notes_low_volume.wav',
-    '10_notes_mixed_volume.wav',
-    '10_notes_off_time.wav',
-    '10_notes_staccato (2).wav'
-]
-
 threshold = 0.14
 
-# Calculate and print the final timing accuracy for each file
-for user_file in user_files:
-    timing_accuracies, final_timing_accuracy = main(original_file, user_file, n_fft_values, threshold)
-    print(f"File: {user_file}, Timing Accuracy Scores: {timing_accuracies}")
-    print(f"Final Timing Accuracy: {final_timing_accuracy:.2f}/10\n")
+if __name__ == '__main__':
+    original_file = 'Original_32_notes.wav'
+    user_files = [
+        '3_extra_notes_2_off_pitch_1_off_timing (2).wav',
+        '5_notes_high_volume.wav',
+        '5_notes_missing (1).wav',
+        '5_notes_off_pitch (3).wav',
+        '5_notes_off_pitch_5_high_v (2).wav',
+        '5_notes_off_time.wav',
+        '7.wav',
+        '8_notes_longer_hold (1).wav',
+        '8.5.wav',
+        '9.5.wav',
+        '10_notes_high_tempo.wav',
+        '10_notes_high_tempo0_notes_low_tempo.wav',
+        '10_notes_low_volume.wav',
+        '10_notes_mixed_volume.wav',
+        '10_notes_off_time.wav',
+        '10_notes_staccato (2).wav'
+    ]
+
+    # Calculate and print the final timing accuracy for each file
+    for user_file in user_files:
+        timing_accuracies, final_timing_accuracy = main(original_file, user_file, n_fft_values, threshold)
+        print(f"File: {user_file}, Timing Accuracy Scores: {timing_accuracies}")
+        print(f"Final Timing Accuracy: {final_timing_accuracy:.2f}/10\n")
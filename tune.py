@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import librosa
+
+import check
+import timing_accuracy
+from benchmark import CORPUS, REFERENCE_FILE
+from matching import nearest_errors
+from spectrogram import compute_resolutions, get_resolution
+
+TOTAL_NOTES = 32
+
+# Tolerance grids; the values currently in use are always added so they can be compared against
+PITCH_TOLERANCES = np.geomspace(1e-4, 1.0, 60)
+DYNAMICS_TOLERANCES_FOR_PITCH = np.concatenate([[0.0], np.geomspace(1e-4, 1.0, 40)])
+TIMING_THRESHOLDS = np.linspace(0.02, 0.4, 39)
+TEN_THRESHOLDS = np.append(np.linspace(0.1, 1.0, 10), np.inf)
+OUTLIER_THRESHOLDS = np.arange(0.5, 10.5, 0.5)
+SPREAD_THRESHOLDS = np.append(np.arange(1.0, 11.0), np.inf)
+PEAK_TIME_TOLERANCES = np.linspace(0.01, 0.4, 40)
+
+PEAK_N_FFT_VALUES = [512, 1024, 2048]
+
+_COUNTS = re.compile(r'(\d+)_(?:notes_)?(extra_notes|off_pitch|off_timing|off_time|missing)')
+
+
+def expected_scores(file_name):
+    # '5_notes_off_pitch (3).wav' -> 27 of 32 notes in tune; '8.5.wav' -> graded 8.5 overall
+    stem = re.sub(r'\s*\(\d+\)$', '', os.path.splitext(os.path.basename(file_name))[0])
+    if re.fullmatch(r'\d+(\.\d+)?', stem):
+        return {"pitch": float(stem), "timing": float(stem)}
+
+    counts = {}
+    for count, kind in _COUNTS.findall(stem):
+        counts[kind] = counts.get(kind, 0) + int(count)
+    missing = counts.get('missing', 0)
+    off_time = counts.get('off_time', 0) + counts.get('off_timing', 0)
+
+    return {
+        "pitch": (TOTAL_NOTES - counts.get('off_pitch', 0) - missing) / TOTAL_NOTES * 10,
+        # How many onsets a tempo change displaces is not in the name
+        "timing": np.nan if 'tempo' in stem else (TOTAL_NOTES - off_time - missing) / TOTAL_NOTES * 10,
+    }
+
+
+def with_current(grid, current):
+    return np.union1d(grid, [current])
+
+
+def count_within_either(a_errors, b_errors, a_grid, b_grid):
+    # For every (a, b) tolerance pair, how many values have a_error <= a or b_error <= b: one 2-D histogram
+    # over each value's first passing grid index, then cumulative sums, instead of a pass per pair
+    a_first = np.searchsorted(a_grid, a_errors, side='left')
+    b_first = np.searchsorted(b_grid, b_errors, side='left')
+    histogram = np.zeros((len(a_grid) + 1, len(b_grid) + 1), dtype=np.int64)
+    np.add.at(histogram, (a_first, b_first), 1)
+    both = histogram.cumsum(axis=0).cumsum(axis=1)[:-1, :-1]
+    a_only = np.bincount(a_first, minlength=len(a_grid) + 1).cumsum()[:-1]
+    b_only = np.bincount(b_first, minlength=len(b_grid) + 1).cumsum()[:-1]
+    return a_only[:, None] + b_only[None, :] - both
+
+
+def extract_corpus(reference_file, takes):
+    # Every spectral feature the sweeps need, computed once; the grids below never touch audio again
+    files = [reference_file] + list(takes)
+    pitch_n_ffts = check.n_fft_values_pitch
+    compute_resolutions(files, pitch_n_ffts, ('frame_peaks',))
+    compute_resolutions(files, timing_accuracy.n_fft_values, ('onset_envelope',))
+    compute_resolutions(files, PEAK_N_FFT_VALUES, ('onset_peaks',))
+
+    reference_peaks = {n_fft: get_resolution(reference_file, n_fft, ('frame_peaks',))['frame_peaks']
+                       for n_fft in pitch_n_ffts}
+    reference_onsets = {n_fft: timing_accuracy.detect_onsets_and_tempo(reference_file, n_fft)
+                        for n_fft in timing_accuracy.n_fft_values}
+    reference_times = {n_fft: get_resolution(reference_file, n_fft, ('onset_peaks',))['onset_peaks'][0]
+                       for n_fft in PEAK_N_FFT_VALUES}
+    reference_rms = timing_accuracy.mean_rms(reference_file)
+
+    corpus = []
+    for take in takes:
+        pitch_errors = []
+        for n_fft in pitch_n_ffts:
+            original_pitches, original_dynamics = reference_peaks[n_fft]
+            user_pitches, user_dynamics = get_resolution(take, n_fft, ('frame_peaks',))['frame_peaks']
+            if original_pitches.size == 0 or user_pitches.size == 0:
+                pitch_errors.append(None)
+                continue
+            pitch_errors.append((
+                nearest_errors(librosa.hz_to_midi(original_pitches), np.sort(librosa.hz_to_midi(user_pitches)), presorted=True),
+                nearest_errors(original_dynamics, np.sort(user_dynamics), presorted=True),
+            ))
+
+        # Timing scores fall back to 5.0 without onsets or when loudness differs too much (see timing_accuracy)
+        loud_mismatch = abs(reference_rms - timing_accuracy.mean_rms(take)) > 0.5
+        onset_errors = []
+        for n_fft in timing_accuracy.n_fft_values:
+            user_onsets = timing_accuracy.detect_onsets_and_tempo(take, n_fft)
+            if loud_mismatch or len(reference_onsets[n_fft]) == 0 or len(user_onsets) == 0:
+                onset_errors.append(None)
+            else:
+                onset_errors.append(np.sort(nearest_errors(reference_onsets[n_fft], user_onsets)))
+
+        peak_errors = []
+        for n_fft in PEAK_N_FFT_VALUES:
+            user_times = get_resolution(take, n_fft, ('onset_peaks',))['onset_peaks'][0]
+            peak_errors.append(np.sort(nearest_errors(reference_times[n_fft], user_times)))
+
+        corpus.append({"file": take, "expected": expected_scores(take), "pitch_errors": pitch_errors,
+                       "onset_errors": onset_errors, "peak_errors": peak_errors})
+    return corpus
+
+
+def sweep_pitch(corpus, pitch_grid, dynamics_grid):
+    # check.calculate_pitch_score averaged over the resolution sweep, for every tolerance pair at once
+    scores = np.zeros((len(corpus), len(pitch_grid), len(dynamics_grid)))
+    for t, take in enumerate(corpus):
+        for errors in take["pitch_errors"]:
+            if errors is not None:
+                correct = count_within_either(errors[0], errors[1], pitch_grid, dynamics_grid)
+                scores[t] += np.round(correct / len(errors[0]) * 10, 2)
+        scores[t] /= len(take["pitch_errors"])
+    return scores
+
+
+def timing_final_scores(scores, ten_grid, outlier_grid, spread_grid):
+    # timing_accuracy.calculate_final_score over resolutions (axis 0), for every grid combination
+    ten_fraction = (scores == 10).mean(axis=0)
+    median = np.median(scores, axis=0)
+    close = np.abs(scores - median)[..., None] <= outlier_grid
+    kept = close.sum(axis=0)
+    filtered = np.where(kept > 0, (scores[..., None] * close).sum(axis=0) / np.maximum(kept, 1), median[:, None])
+    filtered = np.where(filtered >= 9.5, np.round(filtered), filtered)
+    spread = scores.max(axis=0) - scores.min(axis=0)
+
+    final = np.broadcast_to(filtered[:, None, :, None],
+                            (len(median), len(ten_grid), len(outlier_grid), len(spread_grid)))
+    final = np.where(spread[:, None, None, None] > spread_grid, 10.0, final)
+    return np.where(ten_fraction[:, None, None, None] >= ten_grid[:, None, None], 10.0, final)
+
+
+def sweep_timing(corpus, threshold_grid, ten_grid, outlier_grid, spread_grid):
+    results = []
+    for take in corpus:
+        scores = np.full((len(take["onset_errors"]), len(threshold_grid)), 5.0)
+        for r, errors in enumerate(take["onset_errors"]):
+            if errors is not None:
+                scores[r] = np.searchsorted(errors, threshold_grid, side='right') / len(errors) * 10
+        results.append(timing_final_scores(scores, ten_grid, outlier_grid, spread_grid))
+    return np.stack(results)
+
+
+def sweep_peak_timing(corpus, tolerance_grid):
+    # main.calculate_time_accuracy (penalize_missing=False) averaged over compare_n_fft's resolutions
+    scores = np.zeros((len(corpus), len(tolerance_grid)))
+    for t, take in enumerate(corpus):
+        for errors in take["peak_errors"]:
+            scores[t] += np.searchsorted(errors, tolerance_grid, side='right') / len(errors) * 10 if len(errors) else 10
+        scores[t] /= len(take["peak_errors"])
+    return scores
+
+
+def best_settings(scores, expected, grids, current):
+    # Mean absolute error against the labels, over takes whose names encode this score
+    labelled = ~np.isnan(expected)
+    if not labelled.any():
+        return None
+    errors = np.abs(scores[labelled] - expected[labelled].reshape((-1,) + (1,) * (scores.ndim - 1))).mean(axis=0)
+    best = np.unravel_index(np.argmin(errors), errors.shape)
+    current_index = tuple(int(np.flatnonzero(grid == value)[0]) for grid, value in zip(grids.values(), current))
+    return {
+        "best": {name: float(grid[i]) for (name, grid), i in zip(grids.items(), best)},
+        "best_error": float(errors[best]),
+        "current": dict(zip(grids, map(float, current))),
+        "current_error": float(errors[current_index]),
+        "combinations": int(errors.size),
+    }
+
+
+def tune(reference_file, takes):
+    started = time.perf_counter()
+    corpus = extract_corpus(reference_file, takes)
+    extracted = time.perf_counter()
+
+    expected_pitch = np.array([take["expected"]["pitch"] for take in corpus])
+    expected_timing = np.array([take["expected"]["timing"] for take in corpus])
+
+    pitch_grids = {"pitch_tolerance": with_current(PITCH_TOLERANCES, check.pitch_tolerance),
+                   "dynamics_tolerance_for_pitch": with_current(DYNAMICS_TOLERANCES_FOR_PITCH,
+                                                                check.dynamics_tolerance_for_pitch)}
+    timing_grids = {"threshold": with_current(TIMING_THRESHOLDS, timing_accuracy.threshold),
+                    "ten_threshold": with_current(TEN_THRESHOLDS, 0.4),
+                    "outlier_threshold": with_current(OUTLIER_THRESHOLDS, 2),
+                    "spread_threshold": with_current(SPREAD_THRESHOLDS, 5)}
+    peak_grids = {"time_tolerance": with_current(PEAK_TIME_TOLERANCES, 0.15)}
+
+    report = {
+        "check": best_settings(sweep_pitch(corpus, *pitch_grids.values()), expected_pitch, pitch_grids,
+                               (check.pitch_tolerance, check.dynamics_tolerance_for_pitch)),
+        "timing_accuracy": best_settings(sweep_timing(corpus, *timing_grids.values()), expected_timing,
+                                         timing_grids, (timing_accuracy.threshold, 0.4, 2, 5)),
+        "main": best_settings(sweep_peak_timing(corpus, *peak_grids.values()), expected_timing, peak_grids, (0.15,)),
+    }
+    report["seconds"] = {"extract": round(extracted - started, 3), "sweep": round(time.perf_counter() - extracted, 3)}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search tolerance grids against the scores encoded in take names.")
+    parser.add_argument("--reference", default=REFERENCE_FILE)
+    parser.add_argument("takes", nargs="*", default=CORPUS)
+    args = parser.parse_args()
+
+    json.dump(tune(args.reference, args.takes), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+# numba only reads this when librosa first imports it, so it is set before any analysis module loads.
+# librosa's kernels are compiled with cache=True, so later workers load them from here instead of recompiling.
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pymusic", "numba"))
+
+import numpy as np
+
+from audio_cache import DEFAULT_SR
+from features import FEATURES, compute_features
+from metrics import timed, unrecorded
+from streaming import StreamingAnalyzer
+
+WARMUP_SECONDS = 2.0
+WARMUP_NOTES_HZ = (220.0, 330.0, 440.0, 660.0)
+
+_lock = threading.Lock()
+_ready = threading.Event()
+_state = {"status": "cold", "seconds": None, "error": None}
+
+
+def synthetic_take(sr=DEFAULT_SR, seconds=WARMUP_SECONDS):
+    # Short decaying tones with sharp attacks, so onset detection, YIN and piptrack all have work to do
+    t = np.arange(int(sr * seconds / len(WARMUP_NOTES_HZ))) / sr
+    envelope = np.exp(-4 * t)
+    return np.concatenate([envelope * np.sin(2 * np.pi * hz * t) for hz in WARMUP_NOTES_HZ]).astype(np.float32)
+
+
+def warm_up():
+    started = time.perf_counter()
+    # Only the total lands in the metrics, as its own stage; the stages inside it would read as slow requests
+    with timed("warmup"), unrecorded():
+        y = synthetic_take()
+        # Straight to the kernels: nothing here should land in the audio, feature or template caches
+        compute_features(y, DEFAULT_SR, FEATURES)
+        analyzer = StreamingAnalyzer(DEFAULT_SR)
+        analyzer.push(y)
+        analyzer.finish()
+    return time.perf_counter() - started
+
+
+def _run():
+    try:
+        seconds = warm_up()
+        with _lock:
+            _state.update(status="ready", seconds=round(seconds, 3))
+    except Exception as e:
+        # A failed warm-up only costs latency; the worker still serves requests
+        with _lock:
+            _state.update(status="ready", error=f"{type(e).__name__}: {e}")
+    _ready.set()
+
+
+def start_warmup():
+    with _lock:
+        if _state["status"] != "cold":
+            return
+        _state["status"] = "warming"
+    threading.Thread(target=_run, name="warmup", daemon=True).start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def readiness():
+    with _lock:
+        return dict(_state)
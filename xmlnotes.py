@@ -1,19 +1,132 @@
-from music21 import converter, note, chord
-
-# Load the MusicXML file
-score = converter.parse('Original.xml')  # Replace with the path to your XML file
-
-# Iterate through all parts and measures to extract notes
-for part in score.parts:
-    print(f"Part: {part.id}")
-    for measure in part.getElementsByClass('Measure'):
-        print(f"  Measure number: {measure.number}")
-        for element in measure.notes:
-            if isinstance(element, note.Note):
-                pitch = element.pitch
-                duration = element.duration.quarterLength
-                print(f"    Note: {pitch}, Duration: {duration}")
-            elif isinstance(element, chord.Chord):
-                pitches = [p.nameWithOctave for p in element.pitches]
-                duration = element.duration.quarterLength
-                print(f"    Chord: {pitches}, Duration: {duration}")
+import os
+import threading
+
+import numpy as np
+from music21 import converter, note, chord, tempo
+
+from audio_cache import file_hash
+from reference import TEMPLATE_DIR
+
+DEFAULT_TEMPO = 120.0
+
+# Bump whenever parse_score_notes changes what it extracts, so cached note arrays are re-parsed
+SCORE_NOTES_VERSION = 2
+
+_lock = threading.Lock()
+_scores = {}
+
+
+def _top_pitch(element):
+    if isinstance(element, chord.Chord):
+        return max(p.midi for p in element.pitches)
+    return element.pitch.midi
+
+
+def melody_part(score):
+    # A piano score splits into one part per staff; the melody is the staff that sits highest
+    parts = [part for part in score.parts if part.flatten().notes]
+    if not parts:
+        return score
+    return max(parts, key=lambda part: np.median([_top_pitch(element) for element in part.flatten().notes
+                                                  if isinstance(element, (note.Note, chord.Chord))]))
+
+
+def parse_score_notes(xml_file):
+    score = converter.parse(xml_file)
+    part = melody_part(score)
+
+    offsets = []
+    durations = []
+    midi = []
+    for element in part.flatten().notes:
+        if not isinstance(element, (note.Note, chord.Chord)):
+            continue
+        # The melody line sits on top of a chord
+        pitch = _top_pitch(element)
+
+        # Tied continuations lengthen the previous note instead of starting a new one
+        if element.tie is not None and element.tie.type in ('continue', 'stop') and midi and midi[-1] == pitch:
+            durations[-1] += float(element.duration.quarterLength)
+            continue
+
+        offsets.append(float(element.getOffsetInHierarchy(part)))
+        durations.append(float(element.duration.quarterLength))
+        midi.append(pitch)
+
+    marks = score.flatten().getElementsByClass(tempo.MetronomeMark)
+    marked_tempo = float(marks[0].getQuarterBPM()) if len(marks) else np.nan
+
+    # Voices sounding together are one onset: keep only the top note at each offset, so no inter-onset
+    # interval comes out as zero
+    offsets, durations, midi = np.asarray(offsets), np.asarray(durations), np.asarray(midi, dtype=float)
+    order = np.lexsort((-midi, offsets))
+    offsets, durations, midi = offsets[order], durations[order], midi[order]
+    first = np.concatenate([[True], np.diff(offsets) > 0]) if len(offsets) else np.zeros(0, dtype=bool)
+    return {
+        "offsets": offsets[first],
+        "durations": durations[first],
+        "midi": midi[first],
+        "marked_tempo": marked_tempo,
+    }
+
+
+def load_score_notes(xml_file):
+    # Parsing MusicXML is slow, so the note array is cached in memory and next to the reference templates
+    key = file_hash(xml_file)
+    with _lock:
+        notes = _scores.get(key)
+    if notes is not None:
+        return notes
+
+    path = os.path.join(TEMPLATE_DIR, f"score_v{SCORE_NOTES_VERSION}_{key}.npz")
+    if os.path.exists(path):
+        with np.load(path) as data:
+            notes = {name: data[name] for name in data.files}
+        notes["marked_tempo"] = float(notes["marked_tempo"])
+    else:
+        notes = parse_score_notes(xml_file)
+        os.makedirs(TEMPLATE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **notes)
+        os.replace(tmp_path, path)
+
+    with _lock:
+        _scores[key] = notes
+    return notes
+
+
+def score_reference(xml_file, bpm=None):
+    notes = load_score_notes(xml_file)
+    if bpm is None:
+        bpm = notes["marked_tempo"] if not np.isnan(notes["marked_tempo"]) else DEFAULT_TEMPO
+
+    seconds_per_quarter = 60.0 / bpm
+    onset_times = notes["offsets"] * seconds_per_quarter
+    return {
+        "midi": notes["midi"],
+        "onset_times": onset_times,
+        "durations": notes["durations"] * seconds_per_quarter,
+        "inter_onset_intervals": np.diff(onset_times),
+        "tempo": float(bpm),
+    }
+
+
+if __name__ == '__main__':
+    # Load the MusicXML file
+    score = converter.parse('Original.xml')  # Replace with the path to your XML file
+
+    # Iterate through all parts and measures to extract notes
+    for part in score.parts:
+        print(f"Part: {part.id}")
+        for measure in part.getElementsByClass('Measure'):
+            print(f"  Measure number: {measure.number}")
+            for element in measure.notes:
+                if isinstance(element, note.Note):
+                    pitch = element.pitch
+                    duration = element.duration.quarterLength
+                    print(f"    Note: {pitch}, Duration: {duration}")
+                elif isinstance(element, chord.Chord):
+                    pitches = [p.nameWithOctave for p in element.pitches]
+                    duration = element.duration.quarterLength
+                    print(f"    Chord: {pitches}, Duration: {duration}")